@@ -1,41 +1,151 @@
+import argparse
+import importlib.util
+import os
+import resource
+import sys
+from collections.abc import Iterator
+from concurrent.futures import Executor
+from functools import partial
+from pathlib import Path
+
 import trimesh
+from more_itertools import chunked
 
-from holonomy.examples.square_antiprism import square_antiprism
-from holonomy.generate import generate_pegs
+from holonomy import examples
+from holonomy.examples import EXAMPLES
+from holonomy.generate import csg, default_criteria, generate_pegs
+from holonomy.generate.clearance import check_clearance
 from holonomy.generate.model3d import (
+    PRINT_DETAIL,
+    DetailConfig,
     PegsConfig,
     SectionConfig,
-    add_pegs,
-    construct_grooves,
+    construct_groove,
     create_groove_section,
-    cylinder_intersections,
+    instanced_cutters,
+    instanced_pegs,
 )
+from holonomy.generate.parallel import map_meshes, mesh_pool
+from holonomy.graph import Network
 
+SECTION_CONFIG = SectionConfig(
+    height=0.2,
+    width=0.35,
+    rail_height=0.1,
+    rail_width=0.06,
+    bottleneck_height=0.08,
+    bottleneck_width=0.16,
+)
+PEGS_CONFIG = PegsConfig(height=0.1, radius=0.05)
+EXPORT_FORMATS = (".stl", ".3mf", ".ply")
 
-def main():
-    network = generate_pegs(square_antiprism)
-    assert network is not None
 
-    sphere = trimesh.creation.icosphere(subdivisions=4, radius=0.98)
-    config = SectionConfig(
-        height=0.2,
-        width=0.35,
-        rail_height=0.1,
-        rail_width=0.06,
-        bottleneck_height=0.08,
-        bottleneck_width=0.16,
+def cutter_batches(
+    network: Network,
+    config: SectionConfig,
+    detail: DetailConfig,
+    workers: int | None,
+    batch_size: int | None,
+    executor: Executor | None = None,
+) -> Iterator[list[trimesh.Trimesh]]:
+    # Grooves `batch_size` paths at a time (all of them with `None`), the vertex cutters go with the first batch
+    build = partial(construct_groove, section=create_groove_section(config), tolerance=detail.tolerance)
+    paths = [path for _, _, path in network.paths]
+    cutters = [instanced_cutters(config, network, detail)]
+    for batch in list(chunked(paths, batch_size or max(len(paths), 1))) or [[]]:
+        yield map_meshes(build, batch, workers, executor) + cutters
+        cutters = []
+
+
+def build_puzzle(
+    network: Network,
+    config: SectionConfig = SECTION_CONFIG,
+    pegs_config: PegsConfig = PEGS_CONFIG,
+    workers: int | None = 1,
+    detail: DetailConfig = PRINT_DETAIL,
+    batch_size: int | None = None,
+) -> trimesh.Trimesh:
+    # Every part is converted to a manifold once, the cutters are unioned and subtracted `batch_size` grooves at
+    # a time, in a single step with `None`. Only the running result and one batch are held in memory.
+    # Grooves are meshed across `workers` processes (all cores with `None`), pegs and cylinders are instanced.
+    # `detail` trades resolution for speed, `DetailConfig.preset("preview")` is for iterating on a design
+    sphere = trimesh.creation.icosphere(subdivisions=detail.sphere_subdivisions, radius=0.98)
+    body = csg.union([sphere, instanced_pegs(network, pegs_config, config)])
+
+    # Every batch is meshed by the same pool
+    with mesh_pool(workers) as executor:
+        for batch in cutter_batches(network, config, detail, workers, batch_size, executor):
+            body = body - csg.union(batch)
+            # Manifold evaluates lazily, forcing it here lets go of the batch instead of building up the whole tree
+            body.num_tri()
+
+    return csg.to_trimesh(body)
+
+
+def peak_memory() -> int:
+    # Largest resident set of this process or any finished worker, in bytes
+    peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def check_export_format(output: Path):
+    # Checked before anything is built, so a bad output path doesn't cost a whole puzzle build
+    if output.suffix.lower() not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid export format: {output.suffix}. Supported formats are {', '.join(EXPORT_FORMATS)}.")
+    if output.suffix.lower() == ".3mf" and importlib.util.find_spec("lxml") is None:
+        raise ValueError("Invalid export format: .3mf. Exporting 3MF needs the lxml package, which isn't installed.")
+
+
+def export_puzzle(puzzle: trimesh.Trimesh, output: Path):
+    # Written under a temporary name first so a failed export doesn't leave a truncated file behind
+    temporary = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    try:
+        puzzle.export(temporary, file_type=output.suffix.lower().removeprefix("."))
+        os.replace(temporary, output)
+    finally:
+        temporary.unlink(missing_ok=True)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="holonomy")
+    parser.add_argument("--example", default="square_antiprism", choices=EXAMPLES)
+    parser.add_argument("--detail", default="print", choices=("preview", "proof", "print"))
+    parser.add_argument("--output", help="write the puzzle to this .stl, .3mf or .ply file instead of showing it")
+    parser.add_argument(
+        "--batch-size", type=int, default=16, help="grooves subtracted at a time, fewer use less memory"
     )
+    parser.add_argument("--workers", type=int, help="processes meshing the grooves, every core by default")
+    args = parser.parse_args(argv)
 
-    pegs_config = PegsConfig(height=0.1, radius=0.05)
-    peg_meshes = add_pegs(network, pegs_config, config)
-    sphere = trimesh.boolean.union([sphere, *peg_meshes])
-    section = create_groove_section(config)
-    grooves = construct_grooves(network, section)
+    output = None if args.output is None else Path(args.output)
+    if output is not None:
+        check_export_format(output)
 
-    cylinders = cylinder_intersections(config, network)
+    network = examples.get(args.example)
 
-    sphere = trimesh.boolean.difference([sphere, *grooves, *cylinders])
-    sphere.show()
+    # Overlapping grooves only show up in the finished mesh, so they're rejected before any of it is built
+    violations = check_clearance(network, SECTION_CONFIG.width)
+    if violations:
+        closest = min(violations, key=lambda violation: violation.distance)
+        raise ValueError(
+            f"Invalid network: {len(violations)} pairs of grooves overlap, paths {closest.paths} are "
+            f"{closest.distance:.3f} apart while grooves are {SECTION_CONFIG.width} wide."
+        )
+
+    # Which criteria the peg search spends its time on, printed whether or not it finds anything
+    criteria = default_criteria()
+    network = generate_pegs(network, criteria=criteria)
+    print(criteria.report(), file=sys.stderr)
+    assert network is not None
+
+    puzzle = build_puzzle(
+        network, workers=args.workers, detail=DetailConfig.preset(args.detail), batch_size=args.batch_size
+    )
+    if output is None:
+        puzzle.show()
+    else:
+        export_puzzle(puzzle, output)
+    print(f"peak memory {peak_memory() / 2**20:.0f} MiB", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import argparse
+import copy
+import json
+import platform
+import statistics
+import sys
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass
+from functools import cache
+
+import numpy as np
+
+from holonomy import SECTION_CONFIG, build_puzzle, examples
+from holonomy.curves import cubic_bezier_connect, route_bezier_edges
+from holonomy.examples import EXAMPLES
+from holonomy.generate import generate_pegs
+from holonomy.generate.model3d import construct_grooves, create_groove_section
+from holonomy.graph import Graph, Network
+
+FORMAT_VERSION = 1
+
+
+@dataclass
+class Timing:
+    repeats: int
+    median: float
+    minimum: float
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Timing:
+    fn()  # warm up lazily computed caches
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return Timing(repeat, statistics.median(samples), min(samples))
+
+
+@cache
+def pegged_network(name: str) -> Network:
+    network = examples.get(name)
+    pegged = generate_pegs(copy.deepcopy(network), max_iterations=2000, seed=0, progress=False)
+    return network if pegged is None else pegged
+
+
+@cache
+def pegged_graph(name: str) -> Graph:
+    return Graph.from_network(pegged_network(name), legs=(0, 1))
+
+
+def benchmarks(names: list[str]) -> Iterator[tuple[str, Callable[[], object]]]:
+    # Setup happens on first use, inside the warm-up run, so filtered out benchmarks cost nothing
+    section = create_groove_section(SECTION_CONFIG)
+
+    for name in names:
+        yield f"{name}/graph.from_network", lambda name=name: Graph.from_network(pegged_network(name), legs=(0, 1))
+        yield f"{name}/graph.solve", lambda name=name: pegged_graph(name).solve()
+        yield (
+            f"{name}/generate_pegs",
+            lambda name=name: generate_pegs(
+                copy.deepcopy(examples.get(name)), min_length=1000, max_iterations=1000, seed=0, progress=False
+            ),
+        )
+        yield f"{name}/construct_grooves", lambda name=name: construct_grooves(pegged_network(name), section)
+        yield f"{name}/build_puzzle", lambda name=name: build_puzzle(pegged_network(name))
+
+    # One of the square antiprism's edges, fixed so the optimizer does the same work every run
+    start = (np.array([1.0, 0.0, 1.0]) / np.sqrt(2), np.array([-1.0, 0.0, 1.0]) / np.sqrt(2))
+    end = (np.array([0.0, 1.0, 1.0]) / np.sqrt(2), np.array([0.0, -1.0, 1.0]) / np.sqrt(2))
+    yield (
+        "curves/cubic_bezier_connect",
+        lambda: cubic_bezier_connect((start[0], start[1].copy()), (end[0], end[1].copy())),
+    )
+    connections = [(start[0], start[1], end[0], end[1])] * 32
+    yield "curves/route_bezier_edges[grid]", lambda: route_bezier_edges(connections, method="grid")
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    regressions = []
+    for name, timing in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median"], timing["median"]
+        if after > before * (1 + threshold):
+            regressions.append(f"{name}: {before:.4f}s -> {after:.4f}s ({after / before - 1:+.0%})")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m holonomy.bench")
+    parser.add_argument("--output", help="write results as JSON to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown of the median")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", action="append", default=[], help="only run benchmarks containing this string")
+    parser.add_argument("--examples", nargs="+", default=list(EXAMPLES), choices=EXAMPLES)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, fn in benchmarks(args.examples):
+        if args.filter and not any(pattern in name for pattern in args.filter):
+            continue
+        timing = measure(fn, args.repeat)
+        results[name] = asdict(timing)
+        print(f"{name:<45} {timing.median * 1000:>10.2f} ms", file=sys.stderr)
+
+    report = {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != FORMAT_VERSION:
+        print(f"Baseline format version {baseline.get('version')} is not {FORMAT_VERSION}", file=sys.stderr)
+        return 2
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import contextlib
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, Self
+
+import numpy as np
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+
+@dataclass
+class PathCache:
+    directory: Path
+    max_bytes: int = DEFAULT_MAX_BYTES
+
+    @classmethod
+    def from_environment(cls) -> Self | None:
+        # `HOLONOMY_CACHE_DIR=""` disables caching
+        directory = os.environ.get("HOLONOMY_CACHE_DIR")
+        if directory == "":
+            return None
+        if directory is None:
+            directory = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "holonomy"
+        max_bytes = int(os.environ.get("HOLONOMY_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        return cls(Path(directory), max_bytes)
+
+    @staticmethod
+    def key(arrays: list[np.ndarray], **settings) -> str:
+        digest = hashlib.sha256(json.dumps({"version": CACHE_VERSION, **settings}, sort_keys=True).encode())
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.npy"
+
+    def get(self, key: str, mmap_mode: Literal["r", "r+", "c"] | None = None) -> np.ndarray | None:
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode=mmap_mode)
+        except (OSError, ValueError, EOFError):  # missing, or truncated by an interrupted writer
+            return None
+
+        # The modification time doubles as the last use for eviction
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return array
+
+    def put(self, key: str, array: np.ndarray):
+        # Written under a temporary name first so concurrent readers never see a partial file, a cache that
+        # can't be written to is skipped rather than failing the computation it was meant to speed up
+        path = self.path(key)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(temporary, "wb") as f:
+                np.save(f, array)
+            os.replace(temporary, path)
+        except OSError:
+            temporary.unlink(missing_ok=True)
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*.npy"):
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -1,28 +1,143 @@
-from typing import Any
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
 
 import bezier
 import numpy as np
 import scipy
 
+from holonomy.cache import PathCache
+
 
 def spherical_interpolation(v0, v1, num_points=30):
-    arc_points = []
-    for t in np.linspace(0, 1, num_points):
-        p = (1 - t) * v0 + t * v1
-        p /= np.linalg.norm(p)
-        arc_points.append(p)
-    return np.array(arc_points)
+    return spherical_arcs(np.asarray(v0)[None], np.asarray(v1)[None], num_points)[0]
+
+
+def spherical_arcs(v0: np.ndarray, v1: np.ndarray, num_points: int = 30, method: str = "chord") -> np.ndarray:
+    # Arcs between matching rows of `v0` and `v1` as one `(..., num_points, 3)` array. "chord" projects evenly
+    # spaced points of the chord onto the sphere, "slerp" spaces them evenly along the great circle instead,
+    # which matters once the endpoints are far apart
+    t = np.linspace(0, 1, num_points)[:, None]
+    v0, v1 = np.asarray(v0, dtype=float)[..., None, :], np.asarray(v1, dtype=float)[..., None, :]
+
+    match method:
+        case "chord":
+            w0, w1 = 1 - t, t
+        case "slerp":
+            v0 = v0 / np.linalg.norm(v0, axis=-1, keepdims=True)
+            v1 = v1 / np.linalg.norm(v1, axis=-1, keepdims=True)
+            omega = np.arccos(np.clip(np.sum(v0 * v1, axis=-1, keepdims=True), -1, 1))
+            sin_omega = np.sin(omega)
+
+            # Antipodal endpoints have no single great circle between them
+            if np.any(omega > np.pi - 1e-9):
+                raise ValueError("Invalid arc endpoints: antipodal. Supported endpoints are less than pi apart.")
 
+            # Nearly coincident endpoints fall back to the chord, the weights are 0/0 there
+            degenerate = omega < 1e-9
+            sin_omega = np.where(degenerate, 1, sin_omega)
+            w0 = np.where(degenerate, 1 - t, np.sin((1 - t) * omega) / sin_omega)
+            w1 = np.where(degenerate, t, np.sin(t * omega) / sin_omega)
+        case _:
+            raise ValueError(f"Invalid interpolation method: {method}. Supported methods are 'chord' and 'slerp'.")
 
-def curvature(points: np.ndarray) -> np.floating[Any]:
-    dp = (points[2:] - points[:-2]) / 2
-    ddp = points[2:] + points[:-2] - 2 * points[1:-1]
+    # `np.vecdot` rounds like `np.linalg.norm` of a single vector, so arcs match the ones built point by point
+    points = w0 * v0 + w1 * v1
+    return points / np.sqrt(np.vecdot(points, points))[..., None]
 
-    num = np.linalg.norm(np.cross(dp, ddp, axis=1), axis=1)
-    denom = np.linalg.norm(dp, axis=1) ** 3
+
+def curvature(points: np.ndarray) -> np.ndarray:
+    # Works on a single polyline `(N, 3)` as well as on a batch `(..., N, 3)`
+    dp = (points[..., 2:, :] - points[..., :-2, :]) / 2
+    ddp = points[..., 2:, :] + points[..., :-2, :] - 2 * points[..., 1:-1, :]
+
+    # Spelled out per component, the call overhead of `np.cross` and `np.linalg.norm` dominates inside optimizers
+    dx, dy, dz = dp[..., 0], dp[..., 1], dp[..., 2]
+    ddx, ddy, ddz = ddp[..., 0], ddp[..., 1], ddp[..., 2]
+    cx, cy, cz = dy * ddz - dz * ddy, dz * ddx - dx * ddz, dx * ddy - dy * ddx
+
+    num = np.sqrt(cx * cx + cy * cy + cz * cz)
+    denom = (dx * dx + dy * dy + dz * dz) ** 1.5
     return num / denom
 
 
+def resample_adaptive(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # A chord of length `h` across a stretch of curvature `k` strays `k h^2 / 8` from the curve, so keeping every
+    # chord within `tolerance` needs `sqrt(k / (8 tolerance))` points per unit length there. The new points are
+    # spread evenly over the integral of that density, the endpoints are kept exactly
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+
+    # Repeated points have no curvature and would stall the arc length the spline is fitted over
+    if np.any(lengths == 0):
+        points = points[np.concatenate([[True], lengths > 0])]
+        lengths = lengths[lengths > 0]
+    if len(points) < 3:
+        return points
+
+    arc_length = np.concatenate([[0], np.cumsum(lengths)])
+
+    k = curvature(points)
+    k = np.concatenate([k[:1], k, k[-1:]])
+    density = np.maximum(np.sqrt(k / (8 * tolerance)), 1e-9)  # straight stretches still need a monotone map
+    needed = np.concatenate([[0], np.cumsum((density[1:] + density[:-1]) / 2 * lengths)])
+
+    count = max(int(np.ceil(needed[-1])), 1)
+    samples = np.interp(np.linspace(0, needed[-1], count + 1), needed, arc_length)
+    samples[0], samples[-1] = 0, arc_length[-1]
+
+    # Interpolating along the input's own chords would add their sagitta to the error, a spline follows the curve
+    return scipy.interpolate.CubicSpline(arc_length, points, axis=0)(samples)
+
+
+@cache
+def bernstein_basis(num_points: int) -> np.ndarray:
+    t = np.linspace(0, 1, num_points)[:, None]
+    k = np.arange(4)
+    basis = np.array([1, 3, 3, 1]) * t**k * (1 - t) ** (3 - k)
+    basis.setflags(write=False)
+    return basis
+
+
+def cubic_bezier_family(
+    start: tuple[np.ndarray, np.ndarray],
+    end: tuple[np.ndarray, np.ndarray],
+    num_points: int = 100,
+) -> Callable[[np.ndarray | float, np.ndarray | float], np.ndarray]:
+    # Control points are `p0, p0 + alpha * d0, p3 + beta * d3, p3`, so every curve is a fixed part plus
+    # `alpha` and `beta` times two precomputed ones
+    (p0, d0), (p3, d3) = start, end
+    basis = bernstein_basis(num_points)
+
+    fixed = np.outer(basis[:, 0] + basis[:, 1], p0) + np.outer(basis[:, 2] + basis[:, 3], p3)
+    along_start, along_end = np.outer(basis[:, 1], d0), np.outer(basis[:, 2], d3)
+
+    def points(alpha: np.ndarray | float, beta: np.ndarray | float) -> np.ndarray:
+        alpha, beta = np.asarray(alpha)[..., None, None], np.asarray(beta)[..., None, None]
+        points = fixed + alpha * along_start + beta * along_end
+        return points / np.sqrt(np.sum(points * points, axis=-1, keepdims=True))
+
+    return points
+
+
+def cubic_bezier_points(
+    start: tuple[np.ndarray, np.ndarray],
+    end: tuple[np.ndarray, np.ndarray],
+    alpha: np.ndarray | float,
+    beta: np.ndarray | float,
+    num_points: int = 100,
+) -> np.ndarray:
+    return cubic_bezier_family(start, end, num_points)(alpha, beta)
+
+
+def cubic_bezier_reference(nodes: np.ndarray, num_points: int = 100) -> np.ndarray:
+    curve = bezier.Curve(np.asfortranarray(nodes), degree=3)
+    points = curve.evaluate_multi(np.linspace(0, 1, num_points)).T
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+HANDLE_BOUNDS = [(0.01, 1.0), (0.01, 1.0)]
+
+
 def cubic_bezier_connect(
     start: tuple[np.ndarray, np.ndarray],
     end: tuple[np.ndarray, np.ndarray],
@@ -34,30 +149,136 @@ def cubic_bezier_connect(
     d0 /= np.linalg.norm(d0)
     d3 /= np.linalg.norm(d3)
 
+    curve = cubic_bezier_family((p0, d0), (p3, d3), num_points)
+
     def objective(x: np.ndarray) -> float:
         alpha, beta = x
-        p1 = p0 + alpha * d0
-        p2 = p3 + beta * d3
-        nodes = np.asfortranarray(np.stack([p0, p1, p2, p3], axis=1))
-        t_vals = np.linspace(0, 1, num_points)
-
-        points = bezier.Curve(nodes, degree=3).evaluate_multi(t_vals).T
-        points /= np.linalg.norm(points, axis=1, keepdims=True)
-
-        curvature_values = curvature(points)
-        maximum_curvature = np.max(curvature_values)
-        return float(maximum_curvature)
+        return float(np.max(curvature(curve(alpha, beta))))
 
     res = scipy.optimize.direct(
         objective,
-        bounds=[(0.01, 1.0), (0.01, 1.0)],
+        bounds=HANDLE_BOUNDS,
     )
     alpha_opt, beta_opt = res.x
 
-    p1 = p0 + alpha_opt * d0
-    p2 = p3 + beta_opt * d3
-    points = np.stack([p0, p1, p2, p3], axis=1)
-    curve = bezier.Curve(np.asfortranarray(points), degree=3)
-    points = curve.evaluate_multi(np.linspace(0, 1, num_points)).T
-    points /= np.linalg.norm(points, axis=1, keepdims=True)
-    return points
+    return curve(alpha_opt, beta_opt)
+
+
+def route_bezier_edges(
+    connections: Sequence[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]],
+    num_points: int = 100,
+    method: str = "direct",
+    workers: int | None = 1,
+    cache: PathCache | None = None,
+) -> list[np.ndarray]:
+    # Every connection is `(start point, start direction, end point, end direction)`. The direct optimizer
+    # runs on `workers` processes, every core with `None`, which mustn't be asked for while a module is
+    # being imported: the workers would wait on the import lock the parent holds
+    starts = [(np.asarray(p0, dtype=float), np.array(d0, dtype=float)) for p0, d0, _, _ in connections]
+    ends = [(np.asarray(p3, dtype=float), np.array(d3, dtype=float)) for _, _, p3, d3 in connections]
+
+    match method:
+        case "direct":
+            if cache is None:
+                return route_bezier_direct(starts, ends, num_points, workers)
+            return route_bezier_cached(starts, ends, num_points, workers, cache)
+        case "grid":
+            return route_bezier_grid(starts, ends, num_points)
+        case _:
+            raise ValueError(f"Invalid routing method: {method}. Supported methods are 'direct' and 'grid'.")
+
+
+def route_bezier_direct(
+    starts: Sequence[tuple[np.ndarray, np.ndarray]],
+    ends: Sequence[tuple[np.ndarray, np.ndarray]],
+    num_points: int = 100,
+    workers: int | None = 1,
+) -> list[np.ndarray]:
+    if workers == 1 or len(starts) < 2:
+        return [cubic_bezier_connect(start, end, num_points) for start, end in zip(starts, ends, strict=True)]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(cubic_bezier_connect, starts, ends, [num_points] * len(starts)))
+
+
+def route_bezier_cached(
+    starts: Sequence[tuple[np.ndarray, np.ndarray]],
+    ends: Sequence[tuple[np.ndarray, np.ndarray]],
+    num_points: int,
+    workers: int | None,
+    cache: PathCache,
+) -> list[np.ndarray]:
+    # Keyed by the inputs as given and everything the optimizer's result depends on, so a hit is bit-identical
+    settings = {"optimizer": "direct", "bounds": HANDLE_BOUNDS, "num_points": num_points, "scipy": scipy.__version__}
+    keys = [cache.key([*start, *end], **settings) for start, end in zip(starts, ends, strict=True)]
+
+    cached = {i: path for i, key in enumerate(keys) if (path := cache.get(key)) is not None}
+    missing = [i for i in range(len(keys)) if i not in cached]
+    if missing:
+        routed = route_bezier_direct([starts[i] for i in missing], [ends[i] for i in missing], num_points, workers)
+        for i, path in zip(missing, routed, strict=True):
+            cached[i] = path
+            cache.put(keys[i], path)
+        cache.evict()
+    return [cached[i] for i in range(len(keys))]
+
+
+def route_bezier_grid(
+    starts: Sequence[tuple[np.ndarray, np.ndarray]],
+    ends: Sequence[tuple[np.ndarray, np.ndarray]],
+    num_points: int = 100,
+    grid_size: int = 9,
+    rounds: int = 8,
+    chunk_size: int = 32,
+) -> list[np.ndarray]:
+    paths = []
+    for offset in range(0, len(starts), chunk_size):
+        p0, d0 = (np.array(column) for column in zip(*starts[offset : offset + chunk_size], strict=True))
+        p3, d3 = (np.array(column) for column in zip(*ends[offset : offset + chunk_size], strict=True))
+        paths.extend(route_bezier_chunk((p0, d0), (p3, d3), num_points, grid_size, rounds))
+    return paths
+
+
+def route_bezier_chunk(
+    start: tuple[np.ndarray, np.ndarray],
+    end: tuple[np.ndarray, np.ndarray],
+    num_points: int,
+    grid_size: int,
+    rounds: int,
+) -> np.ndarray:
+    # Zooms a `grid_size x grid_size` grid of handle lengths in on the lowest maximum curvature of every
+    # edge, the grids of all edges are evaluated in one broadcasted operation
+    (p0, d0), (p3, d3) = start, end
+    d0 = d0 / np.linalg.norm(d0, axis=1, keepdims=True)
+    d3 = d3 / np.linalg.norm(d3, axis=1, keepdims=True)
+    edges = np.arange(len(p0))
+
+    basis = bernstein_basis(num_points)
+    b0, b1, b2, b3 = (basis[None, :, k, None] for k in range(4))
+    fixed = (b0 + b1) * p0[:, None] + (b2 + b3) * p3[:, None]
+    along_start, along_end = b1 * d0[:, None], b2 * d3[:, None]
+
+    def curves(alpha: np.ndarray, beta: np.ndarray) -> np.ndarray:
+        # `alpha` and `beta` are `(edges, ...)`, the curves `(edges, ..., num_points, 3)`
+        shape = (len(edges), *(1,) * (alpha.ndim - 1), num_points, 3)
+        points = (
+            fixed.reshape(shape)
+            + alpha[..., None, None] * along_start.reshape(shape)
+            + beta[..., None, None] * along_end.reshape(shape)
+        )
+        return points / np.sqrt(np.sum(points * points, axis=-1, keepdims=True))
+
+    bounds = (0.01, 1.0)
+    low, high = np.full((len(edges), 2), bounds[0]), np.full((len(edges), 2), bounds[1])
+    center = (low + high) / 2  # what is left without any `rounds`
+    for _ in range(rounds):
+        ticks = low[..., None] + (high - low)[..., None] * np.linspace(0, 1, grid_size)
+        alpha, beta = np.broadcast_arrays(ticks[:, 0, :, None], ticks[:, 1, None, :])
+
+        objective = np.max(curvature(curves(alpha, beta)), axis=-1).reshape(len(edges), -1)
+        ia, ib = np.divmod(np.argmin(objective, axis=1), grid_size)
+
+        center = np.stack([ticks[edges, 0, ia], ticks[edges, 1, ib]], axis=1)
+        step = (high - low) / (grid_size - 1)
+        low, high = np.maximum(center - step, bounds[0]), np.minimum(center + step, bounds[1])
+
+    return curves(center[:, 0], center[:, 1])
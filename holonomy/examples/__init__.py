@@ -0,0 +1,14 @@
+import importlib
+from functools import cache
+
+from holonomy.graph import Network
+
+# Every example module builds its network at import time, so they are only imported once asked for
+EXAMPLES = ("tetrahedron", "cube", "octahedron", "dodecahedron", "truncated_tetrahedron", "square_antiprism")
+
+
+@cache
+def get(name: str) -> Network:
+    if name not in EXAMPLES:
+        raise ValueError(f"Invalid example: {name}. Supported examples are {', '.join(EXAMPLES)}.")
+    return getattr(importlib.import_module(f"holonomy.examples.{name}"), name)
@@ -1,6 +1,6 @@
 import numpy as np
 
-from holonomy.curves import spherical_interpolation
+from holonomy.curves import spherical_arcs
 from holonomy.graph import Network
 
 R = 1
@@ -73,9 +73,9 @@ z_sphere = R * np.cos(theta_grid)
 arcs = []
 principal_vector = [np.zeros(3) for _ in range(20)]
 
-for u, v in edges:
-    v0, v1 = dodecahedron_vertices[u], dodecahedron_vertices[v]
-    arc = spherical_interpolation(v0, v1, num_points=30)
+sources, targets = np.array(edges).T
+edge_arcs = spherical_arcs(dodecahedron_vertices[sources], dodecahedron_vertices[targets], num_points=30)
+for (u, v), arc in zip(edges, edge_arcs, strict=True):
     arcs.append((u, v, arc))
     principal_vector[u] = arc[1] - arc[0]
     principal_vector[v] = arc[-1] - arc[-2]
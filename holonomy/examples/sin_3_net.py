@@ -2,31 +2,30 @@ import numpy as np
 
 
 def compute_perpendicular_vector(v0, v1, centroid):
+    # Works on single endpoints `(3,)` as well as on rows of them `(E, 3)`
     edge_dir = v1 - v0
-    edge_dir_normalized = edge_dir / np.linalg.norm(edge_dir)
+    edge_dir_normalized = edge_dir / np.linalg.norm(edge_dir, axis=-1, keepdims=True)
     midpoint = (v0 + v1) / 2
     centroid_to_midpoint = midpoint - centroid
-    centroid_to_midpoint_normalized = centroid_to_midpoint / np.linalg.norm(centroid_to_midpoint)
+    centroid_to_midpoint_normalized = centroid_to_midpoint / np.linalg.norm(
+        centroid_to_midpoint, axis=-1, keepdims=True
+    )
 
     perp_dir = np.cross(edge_dir_normalized, centroid_to_midpoint_normalized)
-    perp_dir_normalized = perp_dir / np.linalg.norm(perp_dir)
+    perp_dir_normalized = perp_dir / np.linalg.norm(perp_dir, axis=-1, keepdims=True)
     return perp_dir_normalized
 
 
 def sinusoidal_modulation(v0, v1, centroid, num_points=50, amplitude=0.2):
-    t = np.linspace(0, 1, num_points)
-    edge_vector = v1 - v0
-    perp_dir = compute_perpendicular_vector(v0, v1, centroid)
-    points = []
-    for t_i in t:
-        point = v0 + t_i * edge_vector
-        offset = amplitude * np.sin(2 * np.pi * t_i) * perp_dir
-        points.append(point + offset)
-    return np.array(points)
+    # One period of a sine wave along every edge, `(..., num_points, 3)` for endpoints `(..., 3)`
+    t = np.linspace(0, 1, num_points)[:, None]
+    edge_vector = (v1 - v0)[..., None, :]
+    perp_dir = compute_perpendicular_vector(v0, v1, centroid)[..., None, :]
+    return v0[..., None, :] + t * edge_vector + amplitude * np.sin(2 * np.pi * t) * perp_dir
 
 
 def project_onto_sphere(curve, radius=1):
-    norms = np.linalg.norm(curve, axis=1).reshape(-1, 1)
+    norms = np.linalg.norm(curve, axis=-1, keepdims=True)
     return curve / norms * radius
 
 
@@ -66,9 +65,12 @@ if __name__ == "__main__":
         )
     )
 
-    for edge in edges:
-        v0, v1 = tetrahedron_vertices[edge[0]], tetrahedron_vertices[edge[1]]
-        curve = sinusoidal_modulation(v0, v1, centroid, amplitude=0.2)
+    sources, targets = np.array(edges).T
+    curves = sinusoidal_modulation(
+        tetrahedron_vertices[sources], tetrahedron_vertices[targets], centroid, amplitude=0.2
+    )
+
+    for curve in curves:
         fig.add_trace(
             go.Scatter3d(
                 x=curve[:, 0],
@@ -80,10 +82,7 @@ if __name__ == "__main__":
             )
         )
 
-    for edge in edges:
-        v0, v1 = tetrahedron_vertices[edge[0]], tetrahedron_vertices[edge[1]]
-        curve = sinusoidal_modulation(v0, v1, centroid, amplitude=0.2)
-        projected_curve = project_onto_sphere(curve, R)
+    for projected_curve in project_onto_sphere(curves, R):
         fig.add_trace(
             go.Scatter3d(
                 x=projected_curve[:, 0],
@@ -1,6 +1,7 @@
 import numpy as np
 
-from holonomy.curves import cubic_bezier_connect
+from holonomy.cache import PathCache
+from holonomy.curves import route_bezier_edges
 from holonomy.graph import Network
 
 top_square = []
@@ -99,7 +100,7 @@ square_antiprism = Network(
     kind=4,
 )
 
-bezier_edges = []
+ends, connections = [], []
 for i in range(len(vertices)):
     for dir_i, j in enumerate(sorted_neighbors[i][:4]):
         if i >= j:
@@ -110,8 +111,11 @@ for i in range(len(vertices)):
         direction_i = square_antiprism.directions(i)[dir_i]
         direction_j = square_antiprism.directions(j)[dir_j]
 
-        curve_points = cubic_bezier_connect(start=(vertices[i], direction_i), end=(vertices[j], direction_j))
-        bezier_edges.append((i, j, curve_points))
+        ends.append((i, j))
+        connections.append((vertices[i], direction_i, vertices[j], direction_j))
 
+# Routed serially, worker processes can't be forked while this module is still being imported
+routes = route_bezier_edges(connections, workers=1, cache=PathCache.from_environment())
+bezier_edges = [(i, j, curve) for (i, j), curve in zip(ends, routes, strict=True)]
 square_antiprism.paths = bezier_edges
 square_antiprism.pegs = [(False, False) for _ in range(len(bezier_edges))]
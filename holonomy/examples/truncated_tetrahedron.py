@@ -1,6 +1,7 @@
 import numpy as np
 
-from holonomy.curves import cubic_bezier_connect
+from holonomy.cache import PathCache
+from holonomy.curves import route_bezier_edges
 from holonomy.graph import Network
 
 tetrahedron_vertices = np.array([
@@ -94,7 +95,7 @@ truncated_tetrahedron = Network(
     kind=6,
 )
 
-edges = []
+ends, connections = [], []
 for i in range(len(vertices)):
     for dir_i, j in enumerate(sorted_neighbors[i][:3]):
         if i >= j:
@@ -106,9 +107,12 @@ for i in range(len(vertices)):
         direction_i = truncated_tetrahedron.directions(i)[dir_i]
         direction_j = truncated_tetrahedron.directions(j)[dir_j]
 
-        curve = cubic_bezier_connect(start=(vertices[i], direction_i), end=(vertices[j], direction_j))
-        edges.append((i, j, curve))
+        ends.append((i, j))
+        connections.append((vertices[i], direction_i, vertices[j], direction_j))
 
 
+# Routed serially, worker processes can't be forked while this module is still being imported
+routes = route_bezier_edges(connections, workers=1, cache=PathCache.from_environment())
+edges = [(i, j, curve) for (i, j), curve in zip(ends, routes, strict=True)]
 truncated_tetrahedron.paths = edges
 truncated_tetrahedron.pegs = [(False, False) for _ in range(len(edges))]
@@ -1,60 +1,60 @@
 import copy
 import logging
-from random import choices, random
+import math
+import multiprocessing
+from collections.abc import Hashable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 from more_itertools import pairwise
-from tqdm import trange
+from tqdm import tqdm, trange
 
-from holonomy.examples.dodecahedron import dodecahedron  # noqa: F401
-from holonomy.examples.octahedron import octahedron  # noqa: F401
-from holonomy.examples.square_antiprism import square_antiprism  # noqa: F401
-from holonomy.graph import Graph, Network
+from holonomy import examples
+from holonomy.generate.bridges import BridgeAnalysis
+from holonomy.generate.criteria import Candidate, CriteriaPipeline, Criterion, CriterionStats
+from holonomy.graph import CandidateEdges, Graph, Network
 from holonomy.visualise.graph import compare_views
 
+logger = logging.getLogger(__name__)
 
-def find_hanging_tree(G: nx.Graph, min_size=8):
-    for u, v in nx.bridges(G):
-        G2 = G.copy()
-        G2.remove_edge(u, v)
 
-        comp_u = nx.node_connected_component(G2, u)
-        comp_v = nx.node_connected_component(G2, v)
+def find_hanging_tree(G: nx.Graph, min_size=8, analysis: BridgeAnalysis | None = None):
+    # `analysis` may cover a larger graph that `G` is a connected component of
+    if analysis is None:
+        analysis = BridgeAnalysis.from_graph(G)
 
-        for comp in (comp_u, comp_v):
-            if len(comp) >= min_size:
-                sub = G.subgraph(comp)
-                if nx.is_tree(sub):
-                    return comp, (u, v)
+    for bridge in analysis.bridges:
+        if bridge[0] not in G:
+            continue
 
-    return None
+        for end, side in zip(bridge, analysis.sides[bridge], strict=True):
+            if side.size >= min_size and side.is_tree:
+                return analysis.side_nodes(bridge, end), bridge
 
+    return None
 
-def path_bridges(G: nx.Graph, path: list[tuple[int, int]]) -> list[tuple[tuple[int, int], tuple[int, int]]]:
-    edges = list(pairwise(path))
 
-    return list(bridge for bridge in nx.bridges(G) if bridge in edges)
+def path_bridges(
+    G: nx.Graph, path: list[tuple[int, int]], analysis: BridgeAnalysis | None = None
+) -> list[tuple[Hashable, Hashable]]:
+    if analysis is None:
+        analysis = BridgeAnalysis.from_graph(G)
 
+    bridges = (analysis.find(edge) for edge in pairwise(path))
+    return [bridge for bridge in bridges if bridge is not None]
 
-def path_has_splitting_bridge(G: nx.Graph, path: list[tuple[int, int]]) -> bool:
-    bridges = path_bridges(G, path)
 
-    if not bridges:
-        return False
+def path_has_splitting_bridge(G: nx.Graph, path: list[tuple[int, int]], analysis: BridgeAnalysis | None = None) -> bool:
+    if analysis is None:
+        analysis = BridgeAnalysis.from_graph(G)
 
     total_nodes = G.number_of_nodes()
 
-    for bridge in bridges:
-        G_copy = G.copy()
-        G_copy.remove_edge(*bridge)
-
-        u, v = bridge
-
-        comp_u = nx.node_connected_component(G_copy, u)
-        comp_v = nx.node_connected_component(G_copy, v)
-
-        smaller_comp_size = min(len(comp_u), len(comp_v))
+    for bridge in path_bridges(G, path, analysis):
+        smaller_comp_size = min(side.size for side in analysis.sides[bridge])
 
         if smaller_comp_size / total_nodes >= 0.2:
             return True
@@ -62,29 +62,252 @@ def path_has_splitting_bridge(G: nx.Graph, path: list[tuple[int, int]]) -> bool:
     return False
 
 
-def generate_pegs(network: Network, min_length: int = 0, max_iterations: int = 10000) -> Network | None:
-    options = [(True, False), (False, True), (False, False)]
-    solvable = False
-    for _ in trange(max_iterations):
-        weight = 1.0 + random() * 4.0
-        pegs = choices(options, weights=[weight, weight, 1], k=len(network.paths))
-        network.pegs = pegs
-        graph = Graph.from_network(network, legs=(0, 1))
-        solution = graph.solve()
-
-        subgraph = graph.representation.subgraph(
-            nx.node_connected_component(graph.representation, network.start),
-        )
-
-        solvable = (
-            solution is not None
-            and len(solution) >= min_length
-            and (find_hanging_tree(subgraph) is None)
-            and path_has_splitting_bridge(graph.representation, solution)
-        )
-
-        if solvable:
-            return network
+# Criteria checks are module level rather than lambdas, so pipelines can be sent to worker processes
+def is_solvable(candidate: Candidate) -> bool:
+    return candidate.solution_length > 0
+
+
+def has_min_length(min_length: int, candidate: Candidate) -> bool:
+    return candidate.solution_length >= min_length
+
+
+def has_splitting_bridge(candidate: Candidate) -> bool:
+    solution = candidate.solution
+    return solution is not None and path_has_splitting_bridge(candidate.representation, solution, candidate.bridges)
+
+
+def has_no_hanging_tree(candidate: Candidate) -> bool:
+    return find_hanging_tree(candidate.component, analysis=candidate.bridges) is None
+
+
+def default_criteria(min_length: int = 0) -> CriteriaPipeline:
+    return CriteriaPipeline([
+        Criterion("solvable", 0.0, is_solvable),
+        Criterion("min_length", 0.0, partial(has_min_length, min_length)),
+        Criterion("splitting_bridge", 1.0, has_splitting_bridge),
+        Criterion("no_hanging_tree", 2.0, has_no_hanging_tree),
+    ])
+
+
+def sample_pegs(rng: np.random.Generator, batch: int, path_count: int) -> np.ndarray:
+    # One row of uniforms per candidate, so the stream doesn't depend on how candidates are batched
+    uniform = rng.random((batch, path_count + 1))
+    weight = 1.0 + uniform[:, :1] * 4.0
+    draws = uniform[:, 1:] * (2 * weight + 1)
+
+    # Left and right pegs are each `weight` times as likely as no peg at all
+    pegs = np.zeros((batch, path_count, 2), dtype=bool)
+    pegs[..., 0] = draws < weight
+    pegs[..., 1] = (draws >= weight) & (draws < 2 * weight)
+    return pegs
+
+
+def generate_pegs(
+    network: Network,
+    min_length: int = 0,
+    max_iterations: int = 10000,
+    batch_size: int = 256,
+    seed: int | np.random.Generator | None = None,
+    stop=None,
+    progress: bool = True,
+    criteria: CriteriaPipeline | None = None,
+) -> Network | None:
+    # `min_length` only configures the default criteria
+    if criteria is None:
+        criteria = default_criteria(min_length)
+
+    rng = np.random.default_rng(seed)
+    candidates = CandidateEdges.from_network(network, legs=(0, 1))
+    bar = tqdm(total=max_iterations, disable=not progress)
+    found = None
+    for offset in range(0, max_iterations, batch_size):
+        if stop is not None and stop.is_set():
+            break
+
+        # Solution lengths and component sizes come from one batched search, the criteria only build
+        # a full state graph for candidates that get past the cheap checks
+        batch = sample_pegs(rng, min(batch_size, max_iterations - offset), len(network.paths))
+        evaluation = candidates.evaluate(batch)
+        for row, pegs in enumerate(batch):
+            bar.update()
+            network.pegs = list(map(tuple, pegs.tolist()))
+            if criteria.accepts(Candidate.from_evaluation(candidates, pegs, evaluation, row)):
+                found = network
+                break
+
+        if found is not None:
+            break
+
+    bar.close()
+    logger.info("Peg search criteria:\n%s", criteria.report())
+    return found
+
+
+def score_candidate(candidate: Candidate) -> float:
+    network = candidate.candidates.network
+    total = network.vertex_count * network.kind
+    reach = candidate.component_size / total
+    solution = None if candidate.solution_length == 0 else candidate.solution
+    if solution is None:
+        return reach - 1.0
+
+    # Longer solutions dominate, then a larger reachable component, a bridge on the solution that splits
+    # the state space evenly and no large hanging trees
+    analysis, component = candidate.bridges, candidate.component
+    balance = max(
+        (
+            min(side.size for side in analysis.sides[bridge]) / total
+            for bridge in path_bridges(candidate.representation, solution, analysis)
+        ),
+        default=0.0,
+    )
+    hanging = max(
+        (
+            side.size
+            for bridge, sides in analysis.sides.items()
+            if bridge[0] in component
+            for side in sides
+            if side.is_tree
+        ),
+        default=0,
+    )
+    return candidate.solution_length + 0.5 * reach + 5.0 * min(balance, 0.2) - hanging / total
+
+
+def anneal_pegs(
+    network: Network,
+    min_length: int = 0,
+    max_iterations: int = 10000,
+    seed: int | np.random.Generator | None = None,
+    initial_temperature: float = 2.0,
+    final_temperature: float = 0.05,
+    progress: bool = True,
+    criteria: CriteriaPipeline | None = None,
+) -> Network | None:
+    # `min_length` only configures the default criteria
+    if criteria is None:
+        criteria = default_criteria(min_length)
+
+    rng = np.random.default_rng(seed)
+    options = np.array([(True, False), (False, True), (False, False)])
+    candidates = CandidateEdges.from_network(network, legs=(0, 1))
+    mask = candidates.assign(sample_pegs(rng, 1, len(network.paths))[0])
+
+    current = Candidate.from_mask(mask)
+    current_score = score_candidate(current)
+    accepted = criteria.accepts(current)
+
+    for step in trange(max_iterations, disable=not progress):
+        if accepted or len(network.paths) == 0:
+            break
+
+        progress_ratio = step / max(max_iterations - 1, 1)
+        temperature = initial_temperature * (final_temperature / initial_temperature) ** progress_ratio
+
+        # Move a single path to one of the two peg layouts it doesn't have yet. The mask only updates that path's
+        # edges, and a move away from the start component reuses the current candidate's solution and bridges
+        path = int(rng.integers(len(network.paths)))
+        previous, checkpoint = mask.pegs[path].copy(), mask.checkpoint()
+        others = [option for option in options if not np.array_equal(option, previous)]
+        mask.set_pegs(path, others[rng.integers(len(others))])
+
+        candidate = Candidate.from_mask(mask, current)
+        score = score_candidate(candidate)
+        if score >= current_score or rng.random() < np.exp((score - current_score) / temperature):
+            current, current_score = candidate, score
+            accepted = criteria.accepts(current)
+        else:
+            mask.undo(path, previous, checkpoint)
+
+    logger.info("Annealing criteria:\n%s", criteria.report())
+    if not accepted:
+        return None
+
+    network.pegs = list(map(tuple, current.pegs.tolist()))
+    return network
+
+
+_worker_network: Network | None = None
+_worker_stop = None
+_worker_criteria: list[Criterion] = []
+
+
+def _init_worker(network: Network, stop, criteria: list[Criterion]):
+    global _worker_network, _worker_stop, _worker_criteria
+    _worker_network, _worker_stop, _worker_criteria = network, stop, criteria
+
+
+def _search_worker(
+    seed: int, min_length: int, iterations: int, batch_size: int
+) -> tuple[list[tuple[bool, bool]] | None, dict[str, CriterionStats], int]:
+    assert _worker_network is not None
+    # Fresh counts for every chunk, the parent adds them up
+    criteria = CriteriaPipeline(_worker_criteria)
+    network = generate_pegs(
+        _worker_network,
+        min_length,
+        iterations,
+        batch_size,
+        seed=seed,
+        stop=_worker_stop,
+        progress=False,
+        criteria=criteria,
+    )
+    return None if network is None else network.pegs, criteria.stats, criteria.accepted
+
+
+def generate_pegs_parallel(
+    network: Network,
+    min_length: int = 0,
+    max_iterations: int = 10000,
+    workers: int | None = None,
+    seed: int | None = None,
+    chunk_iterations: int = 1000,
+    batch_size: int = 256,
+    criteria: CriteriaPipeline | None = None,
+) -> tuple[Network, int] | None:
+    # Every chunk is an independent `generate_pegs` run, so the returned seed reproduces the result with
+    # `generate_pegs(network, min_length, chunk_iterations, seed=seed)`. As there, `min_length` only configures
+    # the default criteria. `criteria` is sent to the workers, so its checks have to be picklable, and the
+    # counts of every chunk are added to it
+    if criteria is None:
+        criteria = default_criteria(min_length)
+
+    chunks = math.ceil(max_iterations / chunk_iterations)
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(chunks)]
+    stop = multiprocessing.Event()
+
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(network, stop, criteria.criteria)
+    ) as executor:
+        futures = [
+            executor.submit(
+                _search_worker,
+                chunk_seed,
+                min_length,
+                min(chunk_iterations, max_iterations - i * chunk_iterations),
+                batch_size,
+            )
+            for i, chunk_seed in enumerate(seeds)
+        ]
+
+        # Results are taken in submission order, so the winner doesn't depend on worker scheduling
+        found = None
+        for chunk_seed, future in zip(seeds, futures, strict=True):
+            pegs, _, _ = future.result()
+            if pegs is not None:
+                stop.set()
+                executor.shutdown(cancel_futures=True)
+                network.pegs = pegs
+                found = network, chunk_seed
+                break
+
+    # Every chunk that ran counts, including those still running when the winner was found
+    for future in futures:
+        if not future.cancelled():
+            _, stats, accepted = future.result()
+            criteria.merge(stats, accepted)
+    return found
 
 
 def draw_graph(G: nx.Graph, solution: list[tuple[int, int]] | None):
@@ -121,7 +344,7 @@ def draw_graph(G: nx.Graph, solution: list[tuple[int, int]] | None):
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
-    network = generate_pegs(copy.deepcopy(square_antiprism))
+    network = generate_pegs(copy.deepcopy(examples.get("square_antiprism")))
     assert network is not None
 
     fig = compare_views(
@@ -139,5 +362,5 @@ if __name__ == "__main__":
         print(f"Solution is {solution}, of length {len(solution)}")
         print(f"Stats: {len(path_bridges(graph.representation, solution))=}")
 
-    before = Graph.from_network(dodecahedron, legs=(0, 1))
+    before = Graph.from_network(examples.get("dodecahedron"), legs=(0, 1))
     draw_graph(graph.representation, solution)
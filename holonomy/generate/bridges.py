@@ -0,0 +1,76 @@
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Self
+
+import networkx as nx
+
+
+@dataclass
+class BridgeSide:
+    size: int
+    is_tree: bool
+
+
+@dataclass
+class BridgeAnalysis:
+    graph: nx.Graph
+    bridges: list[tuple[Hashable, Hashable]]  # in `nx.bridges` order
+    sides: dict[tuple[Hashable, Hashable], tuple[BridgeSide, BridgeSide]]  # sides containing the first and second end
+    by_edge: dict[frozenset, tuple[Hashable, Hashable]]  # bridge as oriented above, looked up in either orientation
+
+    @classmethod
+    def from_graph(cls, G: nx.Graph) -> Self:
+        bridges = list(nx.bridges(G))
+
+        # Contract every 2-edge-connected component, the bridges then form a forest over them
+        H = nx.Graph(G)
+        H.remove_edges_from(bridges)
+        label, sizes = {}, []
+        for i, component in enumerate(nx.connected_components(H)):
+            label.update(dict.fromkeys(component, i))
+            sizes.append(len(component))
+
+        # A side of a bridge is a tree exactly when none of its components has an edge of its own
+        internal = [0] * len(sizes)
+        for u, _ in H.edges():
+            internal[label[u]] += 1
+
+        forest = [[] for _ in sizes]
+        for u, v in bridges:
+            forest[label[u]].append(label[v])
+            forest[label[v]].append(label[u])
+
+        parent, root = [-1] * len(sizes), [-1] * len(sizes)
+        subtree_sizes, subtree_internal = list(sizes), list(internal)
+        for start in range(len(sizes)):
+            if root[start] != -1:
+                continue
+            root[start], order, stack = start, [], [start]
+            while stack:
+                node = stack.pop()
+                order.append(node)
+                for child in forest[node]:
+                    if root[child] == -1:
+                        root[child], parent[child] = start, node
+                        stack.append(child)
+            for node in reversed(order[1:]):
+                subtree_sizes[parent[node]] += subtree_sizes[node]
+                subtree_internal[parent[node]] += subtree_internal[node]
+
+        sides = {}
+        for u, v in bridges:
+            cu, cv = label[u], label[v]
+            child = cu if parent[cu] == cv else cv
+            total, total_internal = subtree_sizes[root[child]], subtree_internal[root[child]]
+
+            below = BridgeSide(subtree_sizes[child], subtree_internal[child] == 0)
+            above = BridgeSide(total - below.size, total_internal - subtree_internal[child] == 0)
+            sides[u, v] = (below, above) if child == cu else (above, below)
+
+        return cls(G, bridges, sides, {frozenset(bridge): bridge for bridge in bridges})
+
+    def find(self, edge: tuple[Hashable, Hashable]) -> tuple[Hashable, Hashable] | None:
+        return self.by_edge.get(frozenset(edge))
+
+    def side_nodes(self, bridge: tuple[Hashable, Hashable], end: Hashable) -> set:
+        return nx.node_connected_component(nx.restricted_view(self.graph, [], [bridge]), end)
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+
+import numpy as np
+from rtree import index
+
+from holonomy.graph import Network
+
+
+@dataclass
+class ClearanceViolation:
+    paths: tuple[int, int]  # indices into `network.paths`, equal for a path coming too close to itself
+    distance: float  # smallest distance between the two centerlines
+
+
+def segment_distances(a0: np.ndarray, a1: np.ndarray, b0: np.ndarray, b1: np.ndarray) -> np.ndarray:
+    # Closest points of every pair of segments `a0 a1` and `b0 b1`, clamped on one segment and then the other
+    da, db, r = a1 - a0, b1 - b0, a0 - b0
+    aa, bb = np.sum(da * da, axis=-1), np.sum(db * db, axis=-1)
+    ab, ar, br = np.sum(da * db, axis=-1), np.sum(da * r, axis=-1), np.sum(db * r, axis=-1)
+
+    denom = aa * bb - ab * ab
+    parallel = denom <= 1e-12 * aa * bb
+    s = np.where(parallel, 0, np.clip((ab * br - bb * ar) / np.where(parallel, 1, denom), 0, 1))
+    t = (ab * s + br) / np.where(bb > 0, bb, 1)
+
+    # `t` outside the second segment moves `s` back onto the first one
+    t = np.clip(t, 0, 1)
+    s = np.where(aa > 0, np.clip((ab * t - ar) / np.where(aa > 0, aa, 1), 0, 1), 0)
+    return np.linalg.norm(a0 + s[:, None] * da - b0 - t[:, None] * db, axis=-1)
+
+
+def check_clearance(network: Network, distance: float, vertex_radius: float | None = None) -> list[ClearanceViolation]:
+    # Pairs of paths whose centerlines come closer than `distance`, ignoring segments within `vertex_radius`
+    # (`distance` by default) of a vertex both paths end at
+    vertex_radius = distance if vertex_radius is None else vertex_radius
+    packed = network.packed
+    if len(packed) == 0:
+        return []
+
+    # Segments, with the path they belong to and their distance along it
+    points, offsets = packed.points, packed.offsets
+    keep = np.ones(len(points) - 1, dtype=bool)
+    keep[offsets[1:-1] - 1] = False  # pairs of points that straddle two paths
+    first = np.flatnonzero(keep)
+    path = np.searchsorted(offsets, first, side="right") - 1
+    starts, ends = points[first], points[first + 1]
+    cumulative = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+    along = cumulative[first] - cumulative[offsets[path]]
+    length = cumulative[first + 1] - cumulative[first]
+
+    # Whether the segment lies close to the first and last vertex of its path
+    coords = np.asarray(network.coords, dtype=float)
+    vertices = packed.edges[path]
+    near = np.stack(
+        [
+            np.minimum(
+                np.linalg.norm(starts - coords[vertices[:, end]], axis=1),
+                np.linalg.norm(ends - coords[vertices[:, end]], axis=1),
+            )
+            < vertex_radius
+            for end in range(2)
+        ],
+        axis=1,
+    )
+
+    # Boxes grown by the clearance, every overlap is a candidate pair
+    lower, upper = np.minimum(starts, ends) - distance / 2, np.maximum(starts, ends) + distance / 2
+    tree = index.Index(
+        ((i, (*lower[i], *upper[i]), None) for i in range(len(first))),
+        properties=index.Property(dimension=3),
+    )
+    candidates, counts = tree.intersection_v(lower, upper)
+    a = np.repeat(np.arange(len(first)), counts.astype(np.int64))
+    b = candidates.astype(np.int64)
+    a, b = a[a < b], b[a < b]
+
+    # Segments of one path are close to their neighbours along it, only a fold back onto itself counts there.
+    # Adjacent segments share an endpoint, others are apart by the path between their nearest endpoints
+    same = path[a] == path[b]
+    adjacent = same & (np.abs(first[a] - first[b]) == 1)
+    gap = np.maximum(along[b] - along[a] - length[a], along[a] - along[b] - length[b])
+    # Around a vertex both paths end at they run together by design, either segment being there is enough
+    shared = (vertices[a][:, :, None] == vertices[b][:, None, :]) & (near[a][:, :, None] | near[b][:, None, :])
+    shared = np.any(shared, axis=(1, 2))
+    relevant = ~shared & (~same | (~adjacent & (gap > np.pi * distance / 2)))
+    a, b = a[relevant], b[relevant]
+
+    distances = segment_distances(starts[a], ends[a], starts[b], ends[b])
+    close = distances < distance
+    a, b, distances = a[close], b[close], distances[close]
+
+    pairs, inverse = np.unique(np.sort(np.stack([path[a], path[b]], axis=1), axis=1), axis=0, return_inverse=True)
+    closest = np.full(len(pairs), np.inf)
+    np.minimum.at(closest, inverse.ravel(), distances)
+    return [ClearanceViolation((u, v), d) for (u, v), d in zip(pairs.tolist(), closest.tolist(), strict=True)]
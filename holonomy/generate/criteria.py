@@ -0,0 +1,136 @@
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Self
+
+import networkx as nx
+import numpy as np
+
+from holonomy.generate.bridges import BridgeAnalysis
+from holonomy.graph import CandidateEdges, PegEvaluation, PegMask, StateGraph
+
+
+@dataclass
+class Candidate:
+    candidates: CandidateEdges
+    pegs: np.ndarray
+    solution_length: int  # 0 if unsolvable
+    component_size: int
+    start_version: int | None = None  # `PegMask.start_version` the candidate was built at
+
+    @classmethod
+    def from_evaluation(cls, candidates: CandidateEdges, pegs: np.ndarray, evaluation: PegEvaluation, row: int) -> Self:
+        return cls(candidates, pegs, int(evaluation.solution_lengths[row]), int(evaluation.component_sizes[row]))
+
+    @classmethod
+    def evaluate(cls, candidates: CandidateEdges, pegs: np.ndarray) -> Self:
+        return cls.from_evaluation(candidates, pegs, candidates.evaluate(pegs[None]), 0)
+
+    @classmethod
+    def from_mask(cls, mask: PegMask, previous: "Candidate | None" = None) -> Self:
+        # While the mask's start component is the one `previous` was built at, its state graph, solution and
+        # bridge analysis carry over. They then describe the previous mask away from the start component, which
+        # neither the criteria nor the annealing score look at
+        if previous is not None and previous.start_version == mask.start_version:
+            candidate = cls(
+                mask.candidates, mask.pegs.copy(), previous.solution_length, previous.component_size, mask.start_version
+            )
+            for name in ("states", "solution", "representation", "component", "bridges"):
+                if name in previous.__dict__:
+                    candidate.__dict__[name] = previous.__dict__[name]
+            return candidate
+
+        states = mask.graph()
+        solution = states.solve()
+        candidate = cls(
+            mask.candidates,
+            mask.pegs.copy(),
+            len(solution) if solution else 0,
+            int(mask.reachable.sum()),
+            mask.start_version,
+        )
+        candidate.states, candidate.solution = states, solution
+        return candidate
+
+    @cached_property
+    def states(self) -> StateGraph:
+        return self.candidates.graph(self.pegs)
+
+    @cached_property
+    def solution(self) -> list[tuple[int, int]] | None:
+        return self.states.solve()
+
+    @cached_property
+    def representation(self) -> nx.Graph:
+        return self.states.to_networkx()
+
+    @cached_property
+    def component(self) -> nx.Graph:
+        states = self.states
+        reachable = states.reachable(states.state(*states.network.start))
+        return self.representation.subgraph(states.node(state) for state in reachable)
+
+    @cached_property
+    def bridges(self) -> BridgeAnalysis:
+        return BridgeAnalysis.from_graph(self.representation)
+
+
+@dataclass
+class Criterion:
+    name: str
+    cost: float  # relative, criteria run cheapest first
+    check: Callable[[Candidate], bool]
+
+
+@dataclass
+class CriterionStats:
+    evaluated: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class CriteriaPipeline:
+    criteria: list[Criterion]
+    stats: dict[str, CriterionStats] = field(default_factory=dict)
+    accepted: int = 0
+
+    def __post_init__(self):
+        self.criteria = sorted(self.criteria, key=lambda criterion: criterion.cost)
+        for criterion in self.criteria:
+            self.stats.setdefault(criterion.name, CriterionStats())
+
+    def accepts(self, candidate: Candidate) -> bool:
+        # Lazily computed candidate data is charged to the first criterion that needs it
+        for criterion in self.criteria:
+            stats = self.stats[criterion.name]
+            start = time.perf_counter()
+            passed = criterion.check(candidate)
+            stats.seconds += time.perf_counter() - start
+            stats.evaluated += 1
+
+            if not passed:
+                stats.rejected += 1
+                return False
+
+        self.accepted += 1
+        return True
+
+    def merge(self, stats: dict[str, CriterionStats], accepted: int):
+        # Adds up the counts of another run with the same criteria, such as a worker process's
+        for name, other in stats.items():
+            mine = self.stats.setdefault(name, CriterionStats())
+            mine.evaluated += other.evaluated
+            mine.rejected += other.rejected
+            mine.seconds += other.seconds
+        self.accepted += accepted
+
+    def report(self) -> str:
+        width = max((len(criterion.name) for criterion in self.criteria), default=0)
+        lines = [f"{'criterion':<{width}}  {'evaluated':>9}  {'rejected':>8}  {'seconds':>8}"]
+        for criterion in self.criteria:
+            stats = self.stats[criterion.name]
+            lines.append(f"{criterion.name:<{width}}  {stats.evaluated:>9}  {stats.rejected:>8}  {stats.seconds:>8.3f}")
+        lines.append(f"accepted: {self.accepted}")
+        return "\n".join(lines)
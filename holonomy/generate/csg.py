@@ -0,0 +1,31 @@
+from collections.abc import Iterable
+
+import numpy as np
+import trimesh
+from manifold3d import Error, Manifold, Mesh, OpType
+
+
+def to_manifold(mesh: trimesh.Trimesh) -> Manifold:
+    manifold = Manifold(
+        mesh=Mesh(
+            vert_properties=np.asarray(mesh.vertices, dtype=np.float32),
+            tri_verts=np.asarray(mesh.faces, dtype=np.uint32),
+        )
+    )
+    # Manifold turns anything that isn't a closed volume into an empty solid without complaining
+    if manifold.status() != Error.NoError:
+        raise ValueError(f"Invalid mesh: {manifold.status().name}. Supported meshes are closed volumes.")
+    return manifold
+
+
+def to_trimesh(manifold: Manifold) -> trimesh.Trimesh:
+    mesh = manifold.to_mesh()
+    return trimesh.Trimesh(vertices=mesh.vert_properties[:, :3], faces=mesh.tri_verts, process=False)
+
+
+def union(parts: Iterable[trimesh.Trimesh | Manifold]) -> Manifold:
+    # One batch boolean, Manifold composes disjoint parts directly and reduces the rest as a balanced tree
+    manifolds = [part if isinstance(part, Manifold) else to_manifold(part) for part in parts]
+    if not manifolds:
+        return Manifold()
+    return Manifold.batch_boolean(manifolds, OpType.Add)
@@ -1,9 +1,12 @@
 from dataclasses import astuple, dataclass
+from functools import partial
+from typing import Self
 
 import numpy as np
 import trimesh
-from trimesh.geometry import triangulate_quads
 
+from holonomy.curves import resample_adaptive
+from holonomy.generate.parallel import map_meshes
 from holonomy.graph import Network
 
 
@@ -29,6 +32,28 @@ class PegsConfig:
         return iter(astuple(self))
 
 
+@dataclass
+class DetailConfig:
+    sphere_subdivisions: int
+    cylinder_sections: int
+    tolerance: float | None  # chordal tolerance grooves are resampled to, `None` keeps every path point
+
+    @classmethod
+    def preset(cls, name: str) -> Self:
+        match name:
+            case "preview":
+                return cls(sphere_subdivisions=2, cylinder_sections=12, tolerance=5e-3)
+            case "proof":
+                return cls(sphere_subdivisions=3, cylinder_sections=20, tolerance=1e-3)
+            case "print":
+                return cls(sphere_subdivisions=4, cylinder_sections=32, tolerance=None)
+            case _:
+                raise ValueError(f"Invalid level of detail: {name}. Supported levels are preview, proof and print.")
+
+
+PRINT_DETAIL = DetailConfig.preset("print")
+
+
 def create_groove_section(parameters: SectionConfig) -> np.ndarray:
     h, w, g_h, g_w, bn_h, bn_w = parameters
 
@@ -50,27 +75,44 @@ def create_groove_section(parameters: SectionConfig) -> np.ndarray:
 
 
 def compute_tangents(points: np.ndarray) -> np.ndarray:
-    tangents = [None] * len(points)
-
+    # One-sided differences at the ends, central ones in between
+    tangents = np.empty(points.shape)
     tangents[0] = points[1] - points[0]
-    tangents[0] /= np.linalg.norm(tangents[0])
-    for i in range(1, len(points) - 1):
-        p_prev = points[i - 1]
-        p_next = points[i + 1]
-        tangent = p_next - p_prev
-        tangent /= np.linalg.norm(tangent)
-        tangents[i] = tangent
-
+    tangents[1:-1] = points[2:] - points[:-2]
     tangents[-1] = points[-1] - points[-2]
-    tangents[-1] /= np.linalg.norm(tangents[-1])
 
-    return np.array(tangents)
+    # `np.vecdot` rounds like `np.linalg.norm` of a single vector
+    return tangents / np.sqrt(np.vecdot(tangents, tangents))[:, None]
+
+
+def tangent_at(points: np.ndarray, i: int) -> np.ndarray:
+    # `compute_tangents(points)[i]` without computing the others
+    tangent = points[min(i + 1, len(points) - 1)] - points[max(i - 1, 0)]
+    return tangent / np.linalg.norm(tangent)
+
+
+# Caps of the 12 point groove outline, the one at the end of the groove is flipped to face outwards
+CAP_TRIANGLES = np.array([[1, 2, 5], [1, 5, 10]])
+CAP_QUADS = np.array([[0, 1, 10, 11], [2, 3, 4, 5], [5, 6, 9, 10], [5, 6, 9, 10], [6, 7, 8, 9]])
+
+
+def groove_faces(point_count: int, section_size: int) -> np.ndarray:
+    # Triangles in the order `triangulate_quads` gives for the sides followed by both caps
+    P, C = point_count, section_size
+    ring = np.arange(P - 1)[:, None] * C
+    c, next_c = np.arange(C), (np.arange(C) + 1) % C
+    sides = np.stack([ring + c, ring + C + c, ring + C + next_c, ring + next_c], axis=-1).reshape(-1, 4)
+
+    last = (P - 1) * C
+    quads = np.concatenate([sides, CAP_QUADS, (CAP_QUADS + last)[:, ::-1]])
+    triangles = np.concatenate([CAP_TRIANGLES, (CAP_TRIANGLES + last)[:, ::-1]])
+
+    return np.concatenate([triangles, quads[:, [0, 1, 2]], quads[:, [2, 3, 0]]])
 
 
 def construct_groove_using_sections(path: np.ndarray, section: np.ndarray) -> trimesh.Trimesh:
     points = path
     tangents = compute_tangents(points)
-    sections = []
     n1 = points / np.linalg.norm(points, axis=-1, keepdims=True)
     n2 = np.cross(tangents, n1)
 
@@ -80,91 +122,154 @@ def construct_groove_using_sections(path: np.ndarray, section: np.ndarray) -> tr
     sections = points[:, None, :] + s0[None, :, None] * n2[:, None, :] + s1[None, :, None] * n1[:, None, :]
     P, C, _ = sections.shape
     vertices = sections.reshape(P * C, 3)
-    faces = [
-        [p * C + c, (p + 1) * C + c, (p + 1) * C + (c + 1) % C, p * C + (c + 1) % C]
-        for p in range(P - 1)
-        for c in range(C)
-    ]
-    side1 = [[0, 1, 10, 11], [2, 3, 4, 5], [1, 2, 5], [1, 5, 10], [5, 6, 9, 10], [5, 6, 9, 10], [6, 7, 8, 9]]
-    n = P * C - 12
-    side2 = [
-        [n, n + 1, n + 10, n + 11],
-        [n + 2, n + 3, n + 4, n + 5],
-        [n + 1, n + 2, n + 5],
-        [n + 1, n + 5, n + 10],
-        [n + 5, n + 6, n + 9, n + 10],
-        [n + 5, n + 6, n + 9, n + 10],
-        [n + 6, n + 7, n + 8, n + 9],
-    ]
-    faces += side1
-    faces += [s[::-1] for s in side2]
-    groove = trimesh.Trimesh(vertices, triangulate_quads(faces))
+    groove = trimesh.Trimesh(vertices, groove_faces(P, C))
     groove.update_faces(groove.unique_faces())
     return groove
 
 
-def construct_grooves(network: Network, section: np.ndarray) -> list[trimesh.Trimesh]:
-    return [construct_groove_using_sections(path, section) for _, _, path in network.paths]
+def construct_groove(path: np.ndarray, section: np.ndarray, tolerance: float | None = None) -> trimesh.Trimesh:
+    # With a `tolerance` the path is resampled to as few points as keep it within that chordal distance
+    if tolerance is not None:
+        path = resample_adaptive(path, tolerance)
+    return construct_groove_using_sections(path, section)
+
 
+def construct_grooves(
+    network: Network, section: np.ndarray, tolerance: float | None = None, workers: int | None = 1
+) -> list[trimesh.Trimesh]:
+    paths = [path for _, _, path in network.paths]
+    return map_meshes(partial(construct_groove, section=section, tolerance=tolerance), paths, workers)
 
-def cylinder_intersections(config: SectionConfig, network: Network) -> list[trimesh.Trimesh]:
-    sphere = trimesh.creation.icosphere(subdivisions=4, radius=1.0 - config.bottleneck_height - config.height)
 
-    centers = network.coords
+def inner_sphere(config: SectionConfig, detail: DetailConfig = PRINT_DETAIL) -> trimesh.Trimesh:
+    return trimesh.creation.icosphere(
+        subdivisions=detail.sphere_subdivisions, radius=1.0 - config.bottleneck_height - config.height
+    )
+
+
+def create_cylinder(config: SectionConfig, center: np.ndarray, detail: DetailConfig = PRINT_DETAIL) -> trimesh.Trimesh:
     radius = (config.width**2 + config.rail_width**2) ** 0.5 / 2
     height = config.rail_height * 2
     offset = config.bottleneck_height + config.height - config.rail_height / 2
-    cylinders = []
-    for center in centers:
-        direction = np.array(center)
-        norm = np.linalg.norm(direction)
-        if norm == 0:
-            offset_vec = np.zeros(3)
-        else:
-            direction = direction / norm
-            offset_vec = -direction * offset
 
-        center = np.array(center) + offset_vec
+    direction = np.array(center)
+    norm = np.linalg.norm(direction)
+    if norm == 0:
+        offset_vec = np.zeros(3)
+    else:
+        direction = direction / norm
+        offset_vec = -direction * offset
+
+    center = np.array(center) + offset_vec
+
+    cyl = trimesh.creation.cylinder(radius=radius, height=height, sections=detail.cylinder_sections)
+    T_align = trimesh.geometry.align_vectors([0, 0, 1], direction)
+    cyl.apply_transform(T_align)
+
+    T_move = trimesh.transformations.translation_matrix(center)
+    cyl.apply_transform(T_move)
+    return cyl
+
+
+def create_cylinders(
+    config: SectionConfig, network: Network, workers: int | None = 1, detail: DetailConfig = PRINT_DETAIL
+) -> list[trimesh.Trimesh]:
+    return map_meshes(partial(create_cylinder, config, detail=detail), list(network.coords), workers)
+
 
-        cyl = trimesh.creation.cylinder(radius=radius, height=height, sections=32)
-        T_align = trimesh.geometry.align_vectors([0, 0, 1], direction)
-        cyl.apply_transform(T_align)
+def cylinder_intersection(
+    config: SectionConfig, sphere: trimesh.Trimesh, center: np.ndarray, detail: DetailConfig = PRINT_DETAIL
+) -> trimesh.Trimesh:
+    # `sphere` is the `inner_sphere`, built once by the caller rather than for every vertex
+    return trimesh.boolean.difference([create_cylinder(config, center, detail), sphere])
 
-        T_move = trimesh.transformations.translation_matrix(center)
-        cyl.apply_transform(T_move)
-        cylinders.append(trimesh.boolean.difference([cyl, sphere]))
 
-    return cylinders
+def cylinder_intersections(
+    config: SectionConfig, network: Network, workers: int | None = 1, detail: DetailConfig = PRINT_DETAIL
+) -> list[trimesh.Trimesh]:
+    build = partial(cylinder_intersection, config, inner_sphere(config, detail), detail=detail)
+    return map_meshes(build, list(network.coords), workers)
 
 
-def add_pegs(network: Network, pegs_config: PegsConfig, section_config: SectionConfig) -> list[trimesh.Trimesh]:
-    peg_meshes = []
+def create_peg(pegs_config: PegsConfig, sections: int, placement: tuple[np.ndarray, np.ndarray]) -> trimesh.Trimesh:
+    peg_center, normal = placement
+    peg = trimesh.creation.cylinder(radius=float(pegs_config.radius), height=pegs_config.height, sections=sections)
+    align_matrix = trimesh.geometry.align_vectors([0, 0, 1], normal)
+    peg.apply_transform(align_matrix)
+
+    translation = trimesh.transformations.translation_matrix(peg_center)
+    peg.apply_transform(translation)
+    return peg
+
+
+def peg_placements(network: Network, section_config: SectionConfig) -> list[tuple[np.ndarray, np.ndarray]]:
+    # Center and outward normal of every peg, beside the middle of its path
+    placements = []
     offset_distance = section_config.width / 2
-    radius = float(pegs_config.radius)
-    height = pegs_config.height
 
     for (has_left, has_right), (_, _, path) in zip(network.pegs, network.paths, strict=True):
         mid_point = path[len(path) // 2]
 
-        tangent = compute_tangents(path)[len(path) // 2]
+        tangent = tangent_at(path, len(path) // 2)
         normal = mid_point / np.linalg.norm(mid_point)
 
         side_vector = np.cross(normal, tangent)
         side_vector /= np.linalg.norm(side_vector)
 
         for direction, present in zip([-1, 1], [has_left, has_right], strict=True):
-            if not present:
-                continue
-
-            peg_center = mid_point + direction * offset_distance * side_vector
-
-            peg = trimesh.creation.cylinder(radius=radius, height=height, sections=network.kind)
-            align_matrix = trimesh.geometry.align_vectors([0, 0, 1], normal)
-            peg.apply_transform(align_matrix)
-
-            translation = trimesh.transformations.translation_matrix(peg_center)
-            peg.apply_transform(translation)
-
-            peg_meshes.append(peg)
-
-    return peg_meshes
+            if present:
+                placements.append((mid_point + direction * offset_distance * side_vector, normal))
+
+    return placements
+
+
+def add_pegs(
+    network: Network, pegs_config: PegsConfig, section_config: SectionConfig, workers: int | None = 1
+) -> list[trimesh.Trimesh]:
+    placements = peg_placements(network, section_config)
+    return map_meshes(partial(create_peg, pegs_config, network.kind), placements, workers)
+
+
+def alignment_transforms(origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    # (n, 4, 4) transforms turning the z axis towards each direction and moving the origin to each origin,
+    # the rotations are the ones `align_vectors` gives a single mesh
+    transforms = np.array([trimesh.geometry.align_vectors([0, 0, 1], direction) for direction in directions])
+    transforms = transforms.reshape(-1, 4, 4)
+    transforms[:, :3, 3] = np.reshape(origins, (-1, 3))
+    return transforms
+
+
+def instance_mesh(template: trimesh.Trimesh, transforms: np.ndarray) -> trimesh.Trimesh:
+    # A copy of `template` per transform, all in one mesh
+    vertices = np.einsum("nij,vj->nvi", transforms[:, :3, :3], template.vertices) + transforms[:, None, :3, 3]
+    faces = template.faces[None] + (np.arange(len(transforms)) * len(template.vertices))[:, None, None]
+    return trimesh.Trimesh(vertices.reshape(-1, 3), faces.reshape(-1, 3), process=False)
+
+
+def instanced_pegs(network: Network, pegs_config: PegsConfig, section_config: SectionConfig) -> trimesh.Trimesh:
+    # `add_pegs` as one mesh, stamped out of a single peg
+    placements = peg_placements(network, section_config)
+    centers = np.array([center for center, _ in placements])
+    normals = np.array([normal for _, normal in placements])
+    template = create_peg(pegs_config, network.kind, (np.zeros(3), np.array([0.0, 0.0, 1.0])))
+    return instance_mesh(template, alignment_transforms(centers, normals))
+
+
+def instanced_cutters(config: SectionConfig, network: Network, detail: DetailConfig = PRINT_DETAIL) -> trimesh.Trimesh:
+    # `cylinder_intersections` as one mesh. A vertex's cutter only depends on its distance from the center,
+    # so it is built once per distance with the vertex on the z axis and rotated into place
+    coords = np.asarray(network.coords, dtype=float)
+    distances, inverse = np.unique(np.linalg.norm(coords, axis=1).round(9), return_inverse=True)
+
+    sphere = inner_sphere(config, detail)
+    parts = []
+    for i, distance in enumerate(distances):
+        template = cylinder_intersection(config, sphere, np.array([0.0, 0.0, distance]), detail)
+        selected = coords[inverse.ravel() == i]
+        parts.append(instance_mesh(template, alignment_transforms(np.zeros_like(selected), selected)))
+    if len(parts) == 1:
+        return parts[0]
+    # Typed as any geometry, it is a mesh for meshes
+    merged = trimesh.util.concatenate(parts)
+    assert isinstance(merged, trimesh.Trimesh)
+    return merged
@@ -0,0 +1,78 @@
+import os
+from collections.abc import Callable, Generator, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Self
+
+import numpy as np
+import trimesh
+
+
+@dataclass
+class SharedMesh:
+    # Vertices followed by faces in a shared memory block, the process that loads it unlinks it
+    name: str
+    vertex_count: int
+    face_count: int
+
+    @classmethod
+    def export(cls, mesh: trimesh.Trimesh) -> Self:
+        vertices = np.asarray(mesh.vertices, dtype=np.float64)
+        faces = np.asarray(mesh.faces, dtype=np.int64)
+
+        block = SharedMemory(create=True, size=max(vertices.nbytes + faces.nbytes, 1))
+        np.ndarray(vertices.shape, np.float64, block.buf)[:] = vertices
+        np.ndarray(faces.shape, np.int64, block.buf, offset=vertices.nbytes)[:] = faces
+        block.close()
+        return cls(block.name, len(vertices), len(faces))
+
+    def load(self) -> trimesh.Trimesh:
+        block = SharedMemory(self.name)
+        try:
+            vertices = np.ndarray((self.vertex_count, 3), np.float64, block.buf).copy()
+            faces = np.ndarray((self.face_count, 3), np.int64, block.buf, offset=vertices.nbytes).copy()
+        finally:
+            block.close()
+            block.unlink()
+        # The worker already processed it
+        return trimesh.Trimesh(vertices, faces, process=False)
+
+
+def _export_mesh(build: Callable[[Any], trimesh.Trimesh], item) -> SharedMesh:
+    return SharedMesh.export(build(item))
+
+
+@contextmanager
+def mesh_pool(workers: int | None = None) -> Generator[Executor | None]:
+    # One pool shared by several `map_meshes` calls, `None` when a single worker means building in place
+    if workers == 1:
+        yield None
+        return
+
+    # Workers share the parent's tracker, with one of their own it would unlink blocks the parent hasn't loaded yet
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(workers) as executor:
+        yield executor
+
+
+def map_meshes(
+    build: Callable[[Any], trimesh.Trimesh],
+    items: Sequence,
+    workers: int | None = 1,
+    executor: Executor | None = None,
+) -> list[trimesh.Trimesh]:
+    # Meshes in the order of `items`, `build` has to be picklable and `workers=None` uses every core.
+    # Without an `executor` from `mesh_pool` a pool is started for this call alone
+    if workers == 1 or len(items) < 2:
+        return [build(item) for item in items]
+    if executor is None:
+        with mesh_pool(workers) as pool:
+            return map_meshes(build, items, workers, pool)
+
+    # A few chunks per worker keeps them busy without a round trip per mesh
+    chunksize = max(1, len(items) // (4 * (workers or os.cpu_count() or 1)))
+    return [mesh.load() for mesh in executor.map(partial(_export_mesh, build), items, chunksize=chunksize)]
@@ -1,11 +1,111 @@
 import copy
 import itertools
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Self
 
 import networkx as nx
 import numpy as np
+import scipy
+
+GEOMETRY_FIELDS = frozenset({"paths", "principal_vector", "normal_vector", "kind"})
+
+
+@dataclass
+class DirectionTable:
+    frames: np.ndarray  # (vertex_count, kind, 3), the directions available at every vertex
+    vertices: np.ndarray  # (path_count, 2), first and last vertex of every path
+    endpoints: np.ndarray  # (path_count, 2), direction of the first and last segment, -1 for degenerate paths
+    exits: np.ndarray  # (path_count,), direction of the last segment measured at the first vertex
+
+    @classmethod
+    def from_network(cls, network: "Network") -> Self:
+        m0, n = network.principal_vector, network.normal_vector
+        mp = np.cross(n, m0)
+
+        angles = 2 * np.pi * np.arange(network.kind) / network.kind
+        frames = np.cos(angles)[None, :, None] * m0[:, None, :] + np.sin(angles)[None, :, None] * mp[:, None, :]
+        frames.setflags(write=False)
+
+        packed = network.packed
+        vertices = packed.edges.astype(np.int64)
+        starts, stops = packed.offsets[:-1], packed.offsets[1:]
+        valid = stops - starts > 1
+
+        segments = np.zeros((len(packed), 2, 3))
+        starts, stops = starts[valid], stops[valid]
+        segments[valid, 0] = packed.points[starts + 1] - packed.points[starts]
+        segments[valid, 1] = packed.points[stops - 1] - packed.points[stops - 2]
+
+        endpoints = np.stack(
+            [
+                nearest_directions(network, frames, vertices[:, 0], segments[:, 0]),
+                nearest_directions(network, frames, vertices[:, 1], segments[:, 1]),
+            ],
+            axis=1,
+        )
+        exits = nearest_directions(network, frames, vertices[:, 0], segments[:, 1])
+        endpoints[~valid] = -1
+        exits[~valid] = -1
+        return cls(frames, vertices, endpoints, exits)
+
+    def starting_paths(self, start: tuple[int, int], kind: int) -> np.ndarray:
+        start_v, start_dir = start
+        start_dir_inv = (start_dir + kind // 2) % kind
+
+        u, v = self.vertices.T
+        return ((v == start_v) & (self.exits == start_dir)) | ((u == start_v) & (self.exits == start_dir_inv))
+
+    def select(self, mask: np.ndarray) -> Self:
+        return type(self)(self.frames, self.vertices[mask], self.endpoints[mask], self.exits[mask])
+
+
+def nearest_directions(network: "Network", frames: np.ndarray, vertices: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    m0 = network.principal_vector[vertices]
+    mp = np.cross(network.normal_vector[vertices], m0)
+
+    vectors = m0 * np.sum(vectors * m0, axis=-1, keepdims=True) + mp * np.sum(vectors * mp, axis=-1, keepdims=True)
+    vectors = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    return np.argmax(np.einsum("...kd,...d->...k", frames[vertices], vectors), axis=-1)
+
+
+@dataclass
+class PackedPaths:
+    edges: np.ndarray  # (path_count, 2) int32, first and last vertex of every path
+    points: np.ndarray  # (point_count, 3), all paths back to back
+    offsets: np.ndarray  # (path_count + 1,) int64, path `i` is `points[offsets[i]:offsets[i + 1]]`
+    pegs: np.ndarray  # (path_count, 2) bool
+
+    @classmethod
+    def from_lists(cls, paths: list[tuple[int, int, np.ndarray]], pegs: list[tuple[bool, bool]]) -> Self:
+        points = [np.asarray(path, dtype=float).reshape(-1, 3) for _, _, path in paths]
+        edges = np.array([(u, v) for u, v, _ in paths], dtype=np.int32).reshape(-1, 2)
+        offsets = np.concatenate([[0], np.cumsum([len(path) for path in points], dtype=np.int64)])
+        return cls(
+            edges, np.concatenate([np.zeros((0, 3)), *points]), offsets, np.asarray(pegs, dtype=bool).reshape(-1, 2)
+        )
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def path(self, i: int) -> np.ndarray:
+        return self.points[self.offsets[i] : self.offsets[i + 1]]
+
+    def to_paths(self) -> list[tuple[int, int, np.ndarray]]:
+        # The `Network.paths` layout, every path is a view into `points`
+        bounds = zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist(), strict=True)
+        return [
+            (u, v, self.points[begin:end]) for (u, v), (begin, end) in zip(self.edges.tolist(), bounds, strict=True)
+        ]
+
+    def to_pegs(self) -> list[tuple[bool, bool]]:
+        return [(left, right) for left, right in self.pegs.tolist()]
 
 
 @dataclass
@@ -19,13 +119,45 @@ class Network:
     normal_vector: np.ndarray
     kind: int
 
-    def directions(self, vertex: int) -> np.ndarray:
-        m0, n = self.principal_vector[vertex], self.normal_vector[vertex]
-        mp = np.cross(n, m0)
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in GEOMETRY_FIELDS:
+            self.invalidate()
+        elif name == "pegs":
+            self.__dict__.pop("packed", None)
 
-        return np.array([
-            np.cos(2 * np.pi * i / self.kind) * m0 + np.sin(2 * np.pi * i / self.kind) * mp for i in range(self.kind)
-        ])
+    @classmethod
+    def from_packed(
+        cls,
+        packed: PackedPaths,
+        vertex_count: int,
+        start: tuple[int, int],
+        coords: np.ndarray,
+        principal_vector: np.ndarray,
+        normal_vector: np.ndarray,
+        kind: int,
+    ) -> Self:
+        network = cls(
+            vertex_count, packed.to_paths(), packed.to_pegs(), start, coords, principal_vector, normal_vector, kind
+        )
+        network.packed = packed
+        return network
+
+    @cached_property
+    def packed(self) -> PackedPaths:
+        return PackedPaths.from_lists(self.paths, self.pegs)
+
+    @cached_property
+    def direction_table(self) -> DirectionTable:
+        return DirectionTable.from_network(self)
+
+    def invalidate(self):
+        # Has to be called after mutating paths or pegs in place, reassigning a field is tracked automatically
+        self.__dict__.pop("direction_table", None)
+        self.__dict__.pop("packed", None)
+
+    def directions(self, vertex: int) -> np.ndarray:
+        return self.direction_table.frames[vertex].copy()
 
     def direction(self, vertex: int, vector: np.ndarray) -> int:
         m0 = self.principal_vector[vertex]
@@ -37,6 +169,9 @@ class Network:
         ds = self.directions(vertex)
         return int(np.argmax(np.dot(ds, vector)))
 
+    def directions_of(self, vertices: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        return nearest_directions(self, self.direction_table.frames, vertices, vectors)
+
     def solve(self):
         graph = Graph.from_network(self, legs=(0, 1))
         return graph.solve()
@@ -46,62 +181,347 @@ class Network:
 class Graph:
     network: Network
     representation: nx.Graph
+    states: "StateGraph | None" = None
 
     @classmethod
     def clean_network(cls, network: Network) -> Network:
-        network = copy.deepcopy(network)
-        start_v, start_dir = network.start
-        start_dir_inv = (start_dir + network.kind // 2) % network.kind
-
-        new_paths, new_pegs = [], []
-        for (u, v, path), pegs in zip(network.paths, network.pegs, strict=True):
-            path_dir = network.direction(u, path[-1] - path[-2])
-            if (v == start_v and path_dir == start_dir) or (u == start_v and path_dir == start_dir_inv):
-                continue
-            new_paths.append((u, v, path))
-            new_pegs.append(pegs)
+        table = network.direction_table
+        keep = np.flatnonzero(~table.starting_paths(network.start, network.kind))
+
+        # Shallow, the kept paths share their points with the original network
+        network = copy.copy(network)
 
-        network.paths = new_paths
-        network.pegs = new_pegs
+        network.paths = [network.paths[i] for i in keep]
+        network.pegs = [network.pegs[i] for i in keep]
+        network.direction_table = table.select(keep)
         return network
 
     @classmethod
     def from_network(cls, network: Network, legs: Iterable[int] = ()) -> Self:
-        assert all(0 <= leg < network.kind for leg in legs), f"All legs should be in ({0}..<{network.kind}) range"
+        states = StateGraph.from_network(network, legs)
+        return cls(states.network, states.to_networkx(), states)
+
+    @cached_property
+    def solver(self) -> "Solver":
+        # One search answers `solve`, counting and `hardest` for as long as the graph is kept
+        states = self.states
+        if states is None:
+            states = StateGraph.from_networkx(self.network, self.representation)
+        return states.solver
+
+    def solve(self) -> list[tuple[int, int]] | None:
+        return self.solver.solve()
+
 
-        network = cls.clean_network(network)
+@dataclass
+class StateGraph:
+    network: Network
+    sources: np.ndarray  # state indices, `vertex * kind + direction`
+    targets: np.ndarray
+
+    @property
+    def state_count(self) -> int:
+        return self.network.vertex_count * self.network.kind
+
+    def state(self, vertex: int, direction: int) -> int:
+        return vertex * self.network.kind + direction
+
+    def node(self, state: int) -> tuple[int, int]:
+        vertex, direction = divmod(int(state), self.network.kind)
+        return vertex, direction
+
+    @classmethod
+    def from_network(cls, network: Network, legs: Iterable[int] = ()) -> Self:
+        candidates = CandidateEdges.from_network(network, legs)
+        keep = candidates.mask(network.pegs)
+        return cls(Graph.clean_network(network), candidates.sources[keep], candidates.targets[keep])
+
+    @classmethod
+    def from_networkx(cls, network: Network, representation: nx.Graph) -> Self:
+        kind = network.kind
+        edges = np.array(
+            [(u * kind + du, v * kind + dv) for (u, du), (v, dv) in representation.edges()], dtype=np.int64
+        ).reshape(-1, 2)
+        return cls(network, edges[:, 0], edges[:, 1])
+
+    @cached_property
+    def adjacency(self) -> scipy.sparse.csr_array:
+        n = self.state_count
+        rows = np.concatenate([self.sources, self.targets])
+        cols = np.concatenate([self.targets, self.sources])
+        data = np.ones(len(rows), dtype=bool)
+        return scipy.sparse.coo_array((data, (rows, cols)), shape=(n, n)).tocsr()
+
+    def to_networkx(self) -> nx.Graph:
+        kind = self.network.kind
         representation = nx.Graph()
-        representation.add_nodes_from(itertools.product(range(network.vertex_count), range(network.kind)))
-
-        for direction in range(network.kind):
-            paths_with_pegs = (
-                (pegs, path) for (pegs, path) in zip(network.pegs, network.paths, strict=True) if len(path[2]) > 1
-            )
-            for pegs, (v_from, v_to, path) in paths_with_pegs:
-                first, last = path[1] - path[0], path[-1] - path[-2]
-                dir_first, dir_last = network.direction(v_from, first), network.direction(v_to, last)
-                new_direction = (direction - dir_first + dir_last) % network.kind
-
-                skip_edge = False
-                for leg in legs:
-                    rot_first = (leg + direction - dir_first) % network.kind
-                    check_left = 0 < rot_first < network.kind // 2
-                    check_right = rot_first > network.kind // 2
-                    if (check_left and pegs[0]) or (check_right and pegs[1]):
-                        skip_edge = True
-                        break
-
-                if not skip_edge:
-                    representation.add_edge((v_from, direction), (v_to, new_direction))
-
-        return cls(network, representation)
+        representation.add_nodes_from(itertools.product(range(self.network.vertex_count), range(kind)))
+
+        sources = zip(*(a.tolist() for a in np.divmod(self.sources, kind)), strict=True)
+        targets = zip(*(a.tolist() for a in np.divmod(self.targets, kind)), strict=True)
+        representation.add_edges_from(zip(sources, targets, strict=True))
+        return representation
+
+    def reachable(self, state: int) -> np.ndarray:
+        return scipy.sparse.csgraph.breadth_first_order(
+            self.adjacency, state, directed=False, return_predecessors=False
+        )
+
+    @cached_property
+    def solver(self) -> "Solver":
+        return Solver.from_states(self)
 
     def solve(self) -> list[tuple[int, int]] | None:
-        graph = self.representation
+        return self.solver.solve()
 
-        vertex, direction = self.network.start
-        source, target = (vertex, direction), (vertex, (direction + 1) % self.network.kind)
-        if not nx.has_path(graph, source, target):
+
+@dataclass
+class Solver:
+    states: StateGraph
+    source: int
+    distances: np.ndarray  # edges from the start state, -1 if unreachable
+    dag_sources: np.ndarray  # edges of the shortest path DAG, each leads one step further from the start
+    dag_targets: np.ndarray
+
+    @classmethod
+    def from_states(cls, states: StateGraph) -> Self:
+        source = states.state(*states.network.start)
+        distances = scipy.sparse.csgraph.shortest_path(
+            states.adjacency, directed=False, unweighted=True, indices=source
+        )
+        distances = np.where(np.isinf(distances), -1, distances).astype(np.int64)
+
+        sources = np.concatenate([states.sources, states.targets])
+        targets = np.concatenate([states.targets, states.sources])
+        forward = (distances[sources] >= 0) & (distances[targets] == distances[sources] + 1)
+        return cls(states, source, distances, sources[forward], targets[forward])
+
+    @property
+    def target(self) -> int:
+        vertex, direction = self.states.network.start
+        return self.states.state(vertex, (direction + 1) % self.states.network.kind)
+
+    def _state(self, target: tuple[int, int] | None) -> int:
+        return self.target if target is None else self.states.state(*target)
+
+    def distance(self, target: tuple[int, int] | None = None) -> int | None:
+        distance = int(self.distances[self._state(target)])
+        return None if distance < 0 else distance
+
+    @cached_property
+    def predecessors(self) -> np.ndarray:
+        # Any DAG edge gives a shortest path, take the first one into every state
+        predecessors = np.full(self.states.state_count, -1, dtype=np.int64)
+        predecessors[self.dag_targets[::-1]] = self.dag_sources[::-1]
+        return predecessors
+
+    @cached_property
+    def incoming(self) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(self.dag_targets, kind="stable")
+        offsets = np.searchsorted(self.dag_targets[order], np.arange(self.states.state_count + 1))
+        return self.dag_sources[order], offsets
+
+    @cached_property
+    def path_counts(self) -> np.ndarray:
+        # Python integers, the number of shortest paths grows exponentially with the distance
+        counts = np.zeros(self.states.state_count, dtype=object)
+        counts[self.source] = 1
+
+        levels = self.distances[self.dag_sources]
+        order = np.argsort(levels, kind="stable")
+        for edges in np.split(order, np.flatnonzero(np.diff(levels[order])) + 1):
+            np.add.at(counts, self.dag_targets[edges], counts[self.dag_sources[edges]])
+        return counts
+
+    def solve(self, target: tuple[int, int] | None = None) -> list[tuple[int, int]] | None:
+        state = self._state(target)
+        if self.distances[state] < 0:
             return None
-        path = nx.shortest_path(graph, source, target)
-        return path
+
+        path = [state]
+        while path[-1] != self.source:
+            path.append(int(self.predecessors[path[-1]]))
+        return [self.states.node(state) for state in reversed(path)]
+
+    def count_solutions(self, target: tuple[int, int] | None = None) -> int:
+        return int(self.path_counts[self._state(target)])
+
+    def solutions(self, target: tuple[int, int] | None = None) -> Iterator[list[tuple[int, int]]]:
+        state = self._state(target)
+        if self.distances[state] < 0:
+            return
+
+        sources, offsets = self.incoming
+        stack = [[state]]
+        while stack:
+            path = stack.pop()
+            if path[-1] == self.source:
+                yield [self.states.node(state) for state in reversed(path)]
+                continue
+            for previous in sources[offsets[path[-1]] : offsets[path[-1] + 1]]:
+                stack.append([*path, int(previous)])
+
+    @property
+    def eccentricity(self) -> int:
+        return int(self.distances.max())
+
+    def hardest(self) -> list[tuple[int, int]]:
+        return [self.states.node(state) for state in np.flatnonzero(self.distances == self.eccentricity).tolist()]
+
+
+@dataclass
+class CandidateEdges:
+    network: Network
+    sources: np.ndarray  # every edge some peg assignment could produce, in `StateGraph.from_network` order
+    targets: np.ndarray
+    paths: np.ndarray  # index into `network.paths` of the path every edge runs along
+    blockers: np.ndarray  # (edges, 2), whether a left or right peg on that path removes the edge
+
+    @classmethod
+    def from_network(cls, network: Network, legs: Iterable[int] = ()) -> Self:
+        legs = tuple(legs)
+        assert all(0 <= leg < network.kind for leg in legs), f"All legs should be in ({0}..<{network.kind}) range"
+
+        kind = network.kind
+        table = network.direction_table
+        paths = np.flatnonzero(~table.starting_paths(network.start, kind) & (table.endpoints[:, 0] >= 0))
+        v_from, v_to = table.vertices[paths].T
+        dir_first, dir_last = table.endpoints[paths].T
+
+        # Rows are the direction at `v_from`, columns are paths, matching the order edges used to be inserted in
+        directions = np.arange(kind)[:, None]
+        new_directions = (directions - dir_first + dir_last) % kind
+
+        blockers = np.zeros((kind, len(paths), 2), dtype=bool)
+        for leg in legs:
+            rot_first = (leg + directions - dir_first) % kind
+            blockers[..., 0] |= (rot_first > 0) & (rot_first < kind // 2)
+            blockers[..., 1] |= rot_first > kind // 2
+
+        sources = (v_from * kind + directions).ravel()
+        targets = (v_to * kind + new_directions).ravel()
+        paths = np.broadcast_to(paths, (kind, len(paths))).ravel()
+        return cls(network, sources, targets, paths, blockers.reshape(-1, 2))
+
+    @cached_property
+    def path_offsets(self) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(self.paths, kind="stable")
+        offsets = np.searchsorted(self.paths[order], np.arange(len(self.network.paths) + 1))
+        return order, offsets
+
+    def path_edges(self, path: int) -> np.ndarray:
+        order, offsets = self.path_offsets
+        return order[offsets[path] : offsets[path + 1]]
+
+    def mask(self, pegs) -> np.ndarray:
+        pegs = np.asarray(pegs, dtype=bool).reshape(-1, 2)
+        return ~np.any(self.blockers & pegs[self.paths], axis=1)
+
+    def graph(self, pegs) -> StateGraph:
+        keep = self.mask(pegs)
+        return StateGraph(self.network, self.sources[keep], self.targets[keep])
+
+    @cached_property
+    def incidence(self) -> tuple[scipy.sparse.csr_array, scipy.sparse.csr_array]:
+        n, m = len(self.sources), self.network.vertex_count * self.network.kind
+        ones, edges = np.ones(n, dtype=np.float32), np.arange(n)
+        to_sources = scipy.sparse.csr_array((ones, (edges, self.sources)), shape=(n, m))
+        to_targets = scipy.sparse.csr_array((ones, (edges, self.targets)), shape=(n, m))
+        return to_sources, to_targets
+
+    def evaluate(self, pegs, batch_size: int = 4096) -> "PegEvaluation":
+        pegs = np.asarray(pegs, dtype=bool).reshape(-1, len(self.network.paths), 2)
+        results = [self._evaluate(pegs[i : i + batch_size]) for i in range(0, len(pegs), batch_size)]
+        if not results:
+            empty = np.zeros(0, dtype=np.int64)
+            return PegEvaluation(empty.astype(bool), empty, empty)
+        return PegEvaluation(*(np.concatenate(column) for column in zip(*results, strict=True)))
+
+    def _evaluate(self, pegs: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Level-synchronous BFS from the start state for every row at once, an edge carries the frontier
+        # across only if it is present in that row's mask
+        masks = ~np.any(self.blockers[None] & pegs[:, self.paths], axis=2)
+        to_sources, to_targets = self.incidence
+
+        vertex, direction = self.network.start
+        source = vertex * self.network.kind + direction
+        target = vertex * self.network.kind + (direction + 1) % self.network.kind
+
+        batch, state_count = len(pegs), to_sources.shape[1]
+        visited = np.zeros((batch, state_count), dtype=bool)
+        visited[:, source] = True
+        frontier = visited.copy()
+        lengths = np.zeros(batch, dtype=np.int64)
+
+        level = 1
+        while frontier.any():
+            forward = (frontier[:, self.sources] & masks).astype(np.float32)
+            backward = (frontier[:, self.targets] & masks).astype(np.float32)
+            frontier = ((forward @ to_targets + backward @ to_sources) > 0) & ~visited
+            visited |= frontier
+
+            level += 1
+            lengths[frontier[:, target]] = level
+
+        return lengths > 0, lengths, visited.sum(axis=1)
+
+    def assign(self, pegs) -> "PegMask":
+        pegs = np.array(pegs, dtype=bool).reshape(-1, 2)
+        return PegMask(self, pegs, self.mask(pegs))
+
+
+@dataclass
+class PegEvaluation:
+    solvable: np.ndarray
+    solution_lengths: np.ndarray  # states on a shortest solution, as `len(solve())` would give, 0 if unsolvable
+    component_sizes: np.ndarray  # states reachable from the start
+
+
+@dataclass
+class PegMask:
+    candidates: CandidateEdges
+    pegs: np.ndarray  # (path_count, 2)
+    mask: np.ndarray  # which candidate edges are present
+    start_version: int = 0  # bumped whenever a change may have altered the start component
+    _reachable: np.ndarray | None = None
+
+    def set_pegs(self, path: int, pegs: tuple[bool, bool]) -> np.ndarray:
+        self.pegs[path] = pegs
+        edges = self.candidates.path_edges(path)
+        present = ~np.any(self.candidates.blockers[edges] & self.pegs[path], axis=1)
+
+        changed = edges[present != self.mask[edges]]
+        self.mask[edges] = present
+
+        # Flipping edges only matters for reachability if one of them touches the current start component,
+        # without a known component any change might
+        if len(changed) > 0:
+            reachable = self._reachable
+            if reachable is None or np.any(
+                reachable[self.candidates.sources[changed]] | reachable[self.candidates.targets[changed]]
+            ):
+                self._reachable = None
+                self.start_version += 1
+        return changed
+
+    def checkpoint(self) -> tuple[int, np.ndarray | None]:
+        return self.start_version, self._reachable
+
+    def undo(self, path: int, pegs: tuple[bool, bool], checkpoint: tuple[int, np.ndarray | None]):
+        # Puts back `pegs` from before the `set_pegs` that followed `checkpoint`, the start component with them
+        self.set_pegs(path, pegs)
+        self.start_version, self._reachable = checkpoint
+
+    def graph(self) -> StateGraph:
+        return StateGraph(
+            self.candidates.network, self.candidates.sources[self.mask], self.candidates.targets[self.mask]
+        )
+
+    @property
+    def reachable(self) -> np.ndarray:
+        if self._reachable is None:
+            graph = self.graph()
+            reachable = np.zeros(graph.state_count, dtype=bool)
+            reachable[graph.reachable(graph.state(*self.candidates.network.start))] = True
+            self._reachable = reachable
+        return self._reachable
@@ -0,0 +1,125 @@
+import json
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+from holonomy.graph import DirectionTable, Network, PackedPaths
+
+FORMAT = "holonomy-network"
+FORMAT_VERSION = 1
+
+MmapMode = Literal["r", "r+", "c"]
+
+# Every array is a separate `.npy` file so it can be memory-mapped on its own
+ARRAYS = (
+    "points",  # (total_points, 3), all paths back to back
+    "offsets",  # (path_count + 1,), path `i` is `points[offsets[i]:offsets[i + 1]]`
+    "edges",  # (path_count, 2) int32
+    "pegs",  # `np.packbits` of the flattened (path_count, 2) peg mask
+    "coords",
+    "principal_vector",
+    "normal_vector",
+    "frames",  # the cached direction table, so loading doesn't recompute it
+    "endpoints",
+    "exits",
+)
+
+
+def save_network(network: Network, directory: str | Path):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    packed, table = network.packed, network.direction_table
+    arrays = {
+        "points": packed.points,
+        "offsets": packed.offsets,
+        "edges": packed.edges,
+        "pegs": np.packbits(packed.pegs.reshape(-1)),
+        "coords": np.asarray(network.coords, dtype=float),
+        "principal_vector": np.asarray(network.principal_vector, dtype=float),
+        "normal_vector": np.asarray(network.normal_vector, dtype=float),
+        "frames": table.frames,
+        "endpoints": table.endpoints,
+        "exits": table.exits,
+    }
+    for name in ARRAYS:
+        np.save(directory / f"{name}.npy", arrays[name])
+
+    # Written last, a directory without it is an interrupted save
+    meta = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "vertex_count": network.vertex_count,
+        "path_count": len(network.paths),
+        "start": list(network.start),
+        "kind": network.kind,
+    }
+    with open(directory / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_meta(directory: str | Path) -> dict:
+    with open(Path(directory) / "meta.json") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"Invalid network format: {meta.get('format')}. Supported format is {FORMAT}.")
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Invalid network format version: {meta.get('version')}. Supported version is {FORMAT_VERSION}."
+        )
+    return meta
+
+
+def load_arrays(directory: str | Path, mmap_mode: MmapMode | None = "r") -> dict[str, np.ndarray]:
+    return {name: np.load(Path(directory) / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAYS}
+
+
+def load_pegs(directory: str | Path) -> np.ndarray:
+    # Only reads the bit array, for screening archives without touching the geometry
+    meta = load_meta(directory)
+    packed = np.load(Path(directory) / "pegs.npy")
+    return np.unpackbits(packed, count=2 * meta["path_count"]).reshape(-1, 2).astype(bool)
+
+
+def check_shapes(meta: dict, arrays: dict[str, np.ndarray]):
+    # The direction table is used as is, so arrays that don't match the metadata would only fail deep in a search
+    path_count, vertex_count, kind = meta["path_count"], meta["vertex_count"], meta["kind"]
+    shapes = {
+        "points": (len(arrays["points"]), 3),
+        "offsets": (path_count + 1,),
+        "edges": (path_count, 2),
+        "pegs": ((2 * path_count + 7) // 8,),
+        "coords": (vertex_count, 3),
+        "frames": (vertex_count, kind, 3),
+        "endpoints": (path_count, 2),
+        "exits": (path_count,),
+    }
+    for name, shape in shapes.items():
+        if arrays[name].shape != shape:
+            raise ValueError(
+                f"Invalid network array: {name} has shape {arrays[name].shape}. Supported shape is {shape}."
+            )
+
+
+def load_network(directory: str | Path, mmap_mode: MmapMode | None = "r") -> Network:
+    # With `mmap_mode="r"` the paths are read-only views into the memory-mapped points
+    meta = load_meta(directory)
+    arrays = load_arrays(directory, mmap_mode)
+    check_shapes(meta, arrays)
+
+    pegs = np.unpackbits(arrays["pegs"], count=2 * meta["path_count"]).reshape(-1, 2).astype(bool)
+    packed = PackedPaths(arrays["edges"], arrays["points"], arrays["offsets"], pegs)
+
+    network = Network.from_packed(
+        packed,
+        vertex_count=meta["vertex_count"],
+        start=tuple(meta["start"]),
+        coords=arrays["coords"],
+        principal_vector=arrays["principal_vector"],
+        normal_vector=arrays["normal_vector"],
+        kind=meta["kind"],
+    )
+    table = DirectionTable(arrays["frames"], packed.edges.astype(np.int64), arrays["endpoints"], arrays["exits"])
+    network.direction_table = table
+    return network
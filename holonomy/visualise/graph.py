@@ -4,10 +4,7 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-from holonomy.examples.dodecahedron import dodecahedron  # noqa: F401
-from holonomy.examples.octahedron import octahedron  # noqa: F401
-from holonomy.examples.tetrahedron import tetrahedron  # noqa: F401
-from holonomy.examples.truncated_tetrahedron import truncated_tetrahedron  # noqa: F401
+from holonomy import examples
 from holonomy.graph import Graph, Network
 
 
@@ -50,10 +47,11 @@ def visualize_graph(
         )
 
     nested_coords = {}
+    frames = network.direction_table.frames
 
     for vertex in range(vertex_count):
         base_coord = network.coords[vertex]
-        directions = network.directions(vertex)
+        directions = frames[vertex]
 
         for direction in range(kind):
             match nesting_type:
@@ -136,8 +134,7 @@ def visualize_graph(
         if show_principal_vector:
             for vertex in range(vertex_count):
                 base_coord = network.coords[vertex]
-                directions = network.directions(vertex)
-                first_direction = directions[0] * 0.5
+                first_direction = frames[vertex, 0] * 0.5
                 end_coord = base_coord + first_direction
 
                 fig.add_trace(
@@ -255,7 +252,7 @@ def compare_views(
 
 
 def main():
-    network = octahedron
+    network = examples.get("octahedron")
     nesting_type = "circle"
     scale_factor = 0.1
 
@@ -0,0 +1,34 @@
+import numpy as np
+
+from holonomy.curves import spherical_arcs
+from holonomy.generate.clearance import check_clearance
+from holonomy.graph import Network
+
+
+def single_arc(angle: float, num_points: int) -> Network:
+    coords = np.array([[1.0, 0.0, 0.0], [np.cos(angle), np.sin(angle), 0.0]])
+    arc = spherical_arcs(coords[0], coords[1], num_points=num_points, method="slerp")
+    directions = np.array([arc[1] - arc[0], arc[-1] - arc[-2]])
+    return Network(
+        vertex_count=2,
+        paths=[(0, 1, arc)],
+        pegs=[(False, False)],
+        start=(0, 0),
+        coords=coords,
+        principal_vector=directions / np.linalg.norm(directions, axis=1, keepdims=True),
+        normal_vector=coords,
+        kind=4,
+    )
+
+
+def test_coarse_arc_does_not_overlap_itself():
+    # Segments longer than the clearance used to count as a fold back onto their neighbours
+    for num_points in (4, 5, 6, 8):
+        assert check_clearance(single_arc(np.radians(170), num_points), 0.35) == []
+
+
+def test_arc_folding_back_overlaps_itself():
+    network = single_arc(np.radians(170), 30)
+    _, _, arc = network.paths[0]
+    network.paths = [(0, 1, np.concatenate([arc, arc[::-1][1:] * 1.01]))]
+    assert [violation.paths for violation in check_clearance(network, 0.35)] == [(0, 0)]